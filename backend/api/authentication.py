@@ -0,0 +1,223 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from recipes.models import CustomUser
+
+TOKEN_CACHE_PREFIX = 'token_auth'
+# Поля пользователя, которые хранятся в кеше токенов: проверка прав
+# и профиль, который выводит CustomUserSerializer (в том числе автор
+# созданного рецепта). Пароль и счетчики в кеш не попадают
+TOKEN_USER_FIELDS = (
+    'id', 'is_active', 'is_staff', 'is_superuser',
+    'username', 'email', 'first_name', 'last_name',
+    'avatar', 'avatar_renditions',
+)
+
+
+def get_token_digest(key):
+    """Токен в ключах кеша хранится в виде SHA-256, а не как есть."""
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _token_key(digest):
+    return f'{TOKEN_CACHE_PREFIX}:{digest}'
+
+
+def _user_key(user_id):
+    return f'{TOKEN_CACHE_PREFIX}:user:{user_id}'
+
+
+def _invalidated_key(user_id):
+    return f'{TOKEN_CACHE_PREFIX}:invalidated:{user_id}'
+
+
+class LocalTokenCache:
+    """
+    Поля пользователей токенов в памяти процесса: не больше
+    TOKEN_AUTH_LOCAL_CACHE_SIZE записей, давно не использованные
+    вытесняются первыми, каждая запись живет
+    TOKEN_AUTH_LOCAL_CACHE_TIMEOUT секунд.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = OrderedDict()
+
+    def get(self, digest):
+        with self.lock:
+            entry = self.tokens.get(digest)
+            if entry is None:
+                return None
+            data, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.tokens[digest]
+                return None
+            self.tokens.move_to_end(digest)
+            return data
+
+    def set(self, digest, data):
+        with self.lock:
+            self.tokens[digest] = (
+                data,
+                time.monotonic() + settings.TOKEN_AUTH_LOCAL_CACHE_TIMEOUT
+            )
+            self.tokens.move_to_end(digest)
+            while len(self.tokens) > settings.TOKEN_AUTH_LOCAL_CACHE_SIZE:
+                self.tokens.popitem(last=False)
+
+    def delete(self, digest):
+        with self.lock:
+            self.tokens.pop(digest, None)
+
+    def clear(self):
+        with self.lock:
+            self.tokens.clear()
+
+
+local_tokens = LocalTokenCache()
+
+
+def build_user(data):
+    """
+    Пользователь запроса из закешированных полей TOKEN_USER_FIELDS.
+    Остальные поля отложены и загружаются из базы при обращении,
+    а save() без update_fields записывает только загруженные поля.
+    """
+    field_names = [
+        field.attname for field in CustomUser._meta.concrete_fields
+        if field.attname in data
+    ]
+    return CustomUser.from_db(
+        CustomUser.objects.db, field_names,
+        [data[name] for name in field_names]
+    )
+
+
+def get_cached_user(key):
+    """
+    Поля пользователя токена из кеша: сначала из памяти процесса,
+    затем из общего кеша. None, если токена нет ни там, ни там.
+    """
+    digest = get_token_digest(key)
+    data = local_tokens.get(digest)
+    if data is None:
+        data = cache.get(_token_key(digest))
+        if data is None:
+            return None
+        local_tokens.set(digest, data)
+    return data
+
+
+def cache_token(key, data, started_at):
+    """
+    Сохраняет поля пользователя токена в оба кеша. started_at — время
+    до чтения из базы: если пользователь или токен сброшены позже,
+    данные могли устареть, и запись удаляется. Сброс после проверки
+    сам удалит запись, поэтому старые данные не остаются в кеше.
+    """
+    digest = get_token_digest(key)
+    user_id = data['id']
+    cache.set_many(
+        {_token_key(digest): data, _user_key(user_id): digest},
+        settings.TOKEN_AUTH_CACHE_TIMEOUT
+    )
+    invalidated_at = cache.get(_invalidated_key(user_id))
+    if invalidated_at is not None and invalidated_at >= started_at:
+        cache.delete(_token_key(digest))
+        return
+    local_tokens.set(digest, data)
+
+
+def mark_invalidated(user_id):
+    """
+    Время сброса токенов пользователя: запрос, прочитавший токен
+    из базы раньше, не сохраняет его в кеш (cache_token).
+    """
+    cache.set(
+        _invalidated_key(user_id), time.time_ns(),
+        settings.TOKEN_AUTH_CACHE_TIMEOUT
+    )
+
+
+def invalidate_token(digest):
+    cache.delete(_token_key(digest))
+    local_tokens.delete(digest)
+
+
+def invalidate_token_on_commit(key, user_id):
+    """Сбрасывает токен после фиксации транзакции, в которой он удален."""
+    digest = get_token_digest(key)
+
+    def invalidate():
+        mark_invalidated(user_id)
+        invalidate_token(digest)
+
+    transaction.on_commit(invalidate)
+
+
+def invalidate_user_tokens_on_commit(user_id):
+    """
+    Сбрасывает токен пользователя после фиксации транзакции, в которой
+    пользователь изменен или удален. Токен пользователя находится
+    по записи в общем кеше, без запроса к базе.
+    """
+    def invalidate():
+        mark_invalidated(user_id)
+        digest = cache.get(_user_key(user_id))
+        if digest is not None:
+            cache.delete(_user_key(user_id))
+            invalidate_token(digest)
+
+    transaction.on_commit(invalidate)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication без запроса Token + CustomUser на каждый запрос:
+    поля пользователя для проверки прав и вывода профиля
+    (TOKEN_USER_FIELDS) берутся из памяти процесса (LRU с ограниченным
+    временем жизни записи), затем из общего кеша и только при промахе
+    из базы. Пароль и счетчики в кеш не попадают: request.user
+    загружает их из базы при обращении. Записи сбрасываются сигналами
+    (api.signals) при удалении токена, в том числе
+    в AuthTokenViewSet.logout, и при изменении или удалении
+    пользователя, в том числе при отключении учетной записи.
+    Другие процессы видят сброс после истечения
+    TOKEN_AUTH_LOCAL_CACHE_TIMEOUT.
+    """
+
+    def authenticate_credentials(self, key):
+        if not settings.TOKEN_AUTH_CACHE:
+            return super().authenticate_credentials(key)
+        data = get_cached_user(key)
+        if data is None:
+            started_at = time.time_ns()
+            row = self.get_model().objects.filter(key=key).values(*(
+                f'user__{name}' for name in TOKEN_USER_FIELDS
+            )).first()
+            if row is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            data = {
+                name: row[f'user__{name}'] for name in TOKEN_USER_FIELDS
+            }
+            if not data['is_active']:
+                raise exceptions.AuthenticationFailed(
+                    _('User inactive or deleted.')
+                )
+            cache_token(key, data, started_at)
+        user = build_user(data)
+        model = self.get_model()
+        token = model.from_db(
+            model.objects.db, ['key', 'user_id'], [key, user.pk]
+        )
+        token.user = user
+        return (user, token)
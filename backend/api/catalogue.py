@@ -0,0 +1,138 @@
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from recipes.models import Ingredient
+
+from .versions import bump_model_version_on_commit, get_model_version
+
+# Разделитель названий в общей строке для подстрочного поиска
+NAME_SEPARATOR = '\n'
+# Символ больше любого другого: верхняя граница диапазона по префиксу
+MAX_CHAR = '\U0010ffff'
+
+
+class IngredientIndex:
+    """
+    Компактный индекс справочника ингредиентов в памяти процесса.
+
+    Названия в нижнем регистре хранятся отсортированными: ингредиенты
+    с общим префиксом образуют непрерывный диапазон, который находится
+    двоичным поиском. Для подстрочного поиска названия склеены в одну
+    строку, по которой ищет str.find.
+    """
+
+    def __init__(self, rows, version=None):
+        rows = sorted(rows, key=lambda row: (row[1].casefold(), row[0]))
+        units = {}
+        self.version = version
+        self.ids = array('q', (row[0] for row in rows))
+        self.names = [row[1] for row in rows]
+        self.units = [
+            units.setdefault(row[2], row[2]) for row in rows
+        ]
+        self.keys = [name.casefold() for name in self.names]
+        self.text = NAME_SEPARATOR.join(self.keys)
+        self.offsets = array('q')
+        offset = 0
+        for key in self.keys:
+            self.offsets.append(offset)
+            offset += len(key) + len(NAME_SEPARATOR)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def prefix_range(self, term):
+        """Границы диапазона названий, начинающихся с term."""
+        return (
+            bisect_left(self.keys, term),
+            bisect_left(self.keys, term + MAX_CHAR)
+        )
+
+    def find(self, term, min_contains_length):
+        """
+        Возвращает позиции подходящих ингредиентов: сначала совпадения
+        по началу названия, затем — по подстроке.
+        """
+        term = term.casefold().replace(NAME_SEPARATOR, '')
+        start, stop = self.prefix_range(term)
+        positions = list(range(start, stop))
+        if len(term) < min_contains_length:
+            return positions
+
+        contains = []
+        found = self.text.find(term)
+        while found != -1:
+            position = bisect_right(self.offsets, found) - 1
+            if not start <= position < stop:
+                contains.append(position)
+            if position + 1 == len(self.offsets):
+                break
+            found = self.text.find(term, self.offsets[position + 1])
+        return positions + contains
+
+    def get(self, position):
+        """Ингредиент (без обращения к базе) по позиции в индексе."""
+        return Ingredient(
+            id=self.ids[position],
+            name=self.names[position],
+            measurement_unit=self.units[position]
+        )
+
+    def memory_size(self):
+        """Приблизительный объем памяти, занимаемой индексом, в байтах."""
+        size = sum(
+            sys.getsizeof(container) for container in
+            (self.ids, self.names, self.units, self.keys, self.text,
+             self.offsets)
+        )
+        size += sum(sys.getsizeof(name) for name in self.names)
+        size += sum(sys.getsizeof(key) for key in self.keys)
+        size += sum(sys.getsizeof(unit) for unit in set(self.units))
+        return size
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def build_ingredient_index(version=None):
+    """Строит индекс по всем ингредиентам из базы данных."""
+    return IngredientIndex(
+        Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+        .order_by().iterator(),
+        version
+    )
+
+
+def get_ingredient_index():
+    """
+    Возвращает индекс справочника, перестраивая его при первом обращении
+    и после изменения версии ингредиентов в общем кеше.
+    """
+    global _index
+    version = get_model_version(Ingredient)
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _index_lock:
+        if _index is None or _index.version != version:
+            _index = build_ingredient_index(version)
+        return _index
+
+
+def invalidate_ingredient_index():
+    """
+    Сбрасывает индекс во всех процессах, меняя версию справочника
+    после фиксации транзакции (seed_load загружает данные в транзакции).
+    """
+    bump_model_version_on_commit(Ingredient)
+
+
+def measure_ingredient_index():
+    """Строит индекс и возвращает его вместе со временем построения."""
+    started = time.perf_counter()
+    index = build_ingredient_index()
+    return index, time.perf_counter() - started
@@ -0,0 +1,140 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+
+from django.db.models import F
+from django.http import StreamingHttpResponse
+
+from recipes.models import ShoppingCartAggregate
+
+# Количество строк, забираемых из курсора базы данных за один раз
+EXPORT_CHUNK_SIZE = 500
+
+
+def get_shopping_list_rows(user):
+    """
+    Возвращает итератор по суммированным ингредиентам из списка покупок
+    пользователя. Суммы берутся из ShoppingCartAggregate, строки читаются
+    из курсора порциями, а не целиком.
+    """
+    return (
+        ShoppingCartAggregate.objects.filter(user=user)
+        .values(
+            'ingredient_id',
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            total_amount=F('amount')
+        )
+        .order_by('ingredient__name')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListExporter(ABC):
+    """
+    Базовый класс выгрузки списка покупок.
+    Формирует ответ по одной строке, не собирая весь текст в памяти.
+    """
+    content_type = None
+    extension = None
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def header(self):
+        """Строки перед списком ингредиентов."""
+        return []
+
+    def footer(self):
+        """Строки после списка ингредиентов."""
+        return []
+
+    @abstractmethod
+    def format_row(self, index, row):
+        """Представление одной строки списка."""
+
+    def __iter__(self):
+        yield from self.header()
+        for index, row in enumerate(self.rows):
+            yield self.format_row(index, row)
+        yield from self.footer()
+
+    def as_response(self, filename='shopping_list'):
+        """Возвращает потоковый ответ с файлом списка покупок."""
+        response = StreamingHttpResponse(self, content_type=self.content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="{filename}.{self.extension}"'
+        )
+        return response
+
+
+class TextShoppingListExporter(ShoppingListExporter):
+    """Выгрузка списка покупок в виде текста."""
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
+
+    def header(self):
+        return ['Ваш список покупок:\n\n']
+
+    def format_row(self, index, row):
+        return (
+            f'- {row["ingredient__name"]} '
+            f'({row["ingredient__measurement_unit"]}) — '
+            f'{row["total_amount"]}\n'
+        )
+
+
+class CSVShoppingListExporter(ShoppingListExporter):
+    """Выгрузка списка покупок в формате CSV."""
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def __init__(self, rows):
+        super().__init__(rows)
+        self.writer = csv.writer(Echo())
+
+    def header(self):
+        return [self.writer.writerow(
+            ['Ингредиент', 'Единица измерения', 'Количество']
+        )]
+
+    def format_row(self, index, row):
+        return self.writer.writerow([
+            row['ingredient__name'],
+            row['ingredient__measurement_unit'],
+            row['total_amount']
+        ])
+
+
+class JSONShoppingListExporter(ShoppingListExporter):
+    """Выгрузка списка покупок в формате JSON (массив объектов)."""
+    content_type = 'application/json'
+    extension = 'json'
+
+    def header(self):
+        return ['[']
+
+    def footer(self):
+        return [']']
+
+    def format_row(self, index, row):
+        item = json.dumps({
+            'name': row['ingredient__name'],
+            'measurement_unit': row['ingredient__measurement_unit'],
+            'amount': row['total_amount']
+        }, ensure_ascii=False)
+        return item if index == 0 else f',{item}'
+
+
+SHOPPING_LIST_EXPORTERS = {
+    'txt': TextShoppingListExporter,
+    'csv': CSVShoppingListExporter,
+    'json': JSONShoppingListExporter,
+}
@@ -1,10 +1,22 @@
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Coalesce
 from django_filters import rest_framework as filters
 
-from recipes.models import Recipe
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+
+# Ранжированные сортировки ленты и поле рейтинга RecipeScore
+RANKED_ORDERINGS = {
+    'popular': 'popular',
+    'trending': 'trending',
+}
 
 
 class RecipeFilter(filters.FilterSet):
-    """Фильтры для рецептов: избранное, список покупок, автор и теги."""
+    """
+    Фильтры для рецептов: избранное, список покупок, автор и теги,
+    а также сортировка по рейтингу.
+    """
     is_favorited = filters.BooleanFilter(
         method='filter_is_favorited', label='Избранное'
     )
@@ -22,28 +34,59 @@ class RecipeFilter(filters.FilterSet):
         label='Теги',
         method='filter_by_tags'
     )
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RANKED_ORDERINGS],
+        method='filter_ordering',
+        label='Сортировка'
+    )
 
     class Meta:
         model = Recipe
-        fields = ['is_favorited', 'is_in_shopping_cart', 'author', 'tags']
+        fields = [
+            'is_favorited', 'is_in_shopping_cart', 'author', 'tags',
+            'ordering'
+        ]
 
     def filter_is_favorited(self, queryset, name, value):
         """Фильтрация по избранным рецептам."""
         user = self.request.user
         if value and not user.is_anonymous:
-            return queryset.filter(is_favorited_by__id=user.id)
+            return queryset.filter(Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ))
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         """Фильтрация по рецептам в корзине покупок."""
         user = self.request.user
         if value and not user.is_anonymous:
-            return queryset.filter(is_in_shopping_cart__id=user.id)
+            return queryset.filter(Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ))
         return queryset
 
     def filter_by_tags(self, queryset, name, value):
-        """Фильтрация по тегам (по slug)."""
+        """
+        Фильтрация по тегам (по slug).
+        Подзапрос EXISTS по промежуточной таблице не размножает строки
+        рецептов, поэтому DISTINCT не нужен.
+        """
         tag_slugs = self.request.query_params.getlist('tags')
         if tag_slugs:
-            return queryset.filter(tags__slug__in=tag_slugs).distinct()
+            return queryset.filter(Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef('pk'), tag__slug__in=tag_slugs
+                )
+            ))
         return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        """
+        Сортировка по предварительно рассчитанному рейтингу
+        (см. update_recipe_scores). Рецепты, для которых рейтинг еще
+        не рассчитан, не пропадают из ленты, а получают нулевой рейтинг.
+        """
+        field = RANKED_ORDERINGS[value]
+        return queryset.annotate(
+            rank=Coalesce(f'score__{field}', 0.0)
+        ).order_by('-rank', '-pk')
@@ -0,0 +1,141 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import CharField, Prefetch, Value
+
+from recipes.models import (CustomUser, Favorite, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingCart,
+                            Subscription, Tag)
+
+from .serializers import RecipeListSerializer
+from .versions import get_model_versions, get_object_versions
+
+FRAGMENT_KEY_PREFIX = 'recipe_fragment'
+
+
+def get_fragment_keys(request, recipes):
+    """
+    Ключи фрагментов: версии рецепта и его автора, версии справочников
+    и адрес сайта, от которого зависят абсолютные ссылки на изображения.
+    """
+    catalogue = get_model_versions((Tag, Ingredient))
+    versions = get_object_versions(
+        [(Recipe, recipe.id) for recipe in recipes]
+        + [(CustomUser, recipe.author_id) for recipe in recipes]
+    )
+    host = f'{request.scheme}://{request.get_host()}'
+    return {
+        recipe.id: (
+            f'{FRAGMENT_KEY_PREFIX}:{recipe.id}:'
+            f'{versions[Recipe, recipe.id]}:'
+            f'{versions[CustomUser, recipe.author_id]}:'
+            f'{catalogue[0]}:{catalogue[1]}:{host}'
+        )
+        for recipe in recipes
+    }
+
+
+def render_fragments(recipe_ids, request):
+    """Сериализует рецепты без флагов пользователя."""
+    recipes = Recipe.objects.filter(id__in=recipe_ids).select_related(
+        'author'
+    ).prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.all()),
+        Prefetch(
+            'ingredient_in_recipe',
+            queryset=IngredientInRecipe.objects.select_related('ingredient')
+        )
+    )
+    for recipe in recipes:
+        recipe.is_favorited = recipe.is_in_cart = False
+        recipe.author_is_subscribed = False
+    data = RecipeListSerializer(
+        recipes, many=True, context={'request': request}
+    ).data
+    return {fragment['id']: fragment for fragment in data}
+
+
+def get_viewer_flags(user, recipe_ids, author_ids):
+    """
+    Избранное, список покупок и подписки пользователя для страницы
+    одним запросом. Возвращает словарь {вид: множество id}.
+    """
+    flags = {'favorite': set(), 'cart': set(), 'subscription': set()}
+    if not recipe_ids:
+        return flags
+    favorites = Favorite.objects.filter(
+        user=user, recipe_id__in=recipe_ids
+    ).annotate(
+        kind=Value('favorite', output_field=CharField())
+    ).values_list('kind', 'recipe_id').order_by()
+    carts = ShoppingCart.objects.filter(
+        user=user, recipe_id__in=recipe_ids
+    ).annotate(
+        kind=Value('cart', output_field=CharField())
+    ).values_list('kind', 'recipe_id').order_by()
+    subscriptions = Subscription.objects.filter(
+        follower=user, author_id__in=author_ids
+    ).annotate(
+        kind=Value('subscription', output_field=CharField())
+    ).values_list('kind', 'author_id').order_by()
+    for kind, pk in favorites.union(carts, subscriptions, all=True):
+        flags[kind].add(pk)
+    return flags
+
+
+def render_recipe_page(recipes, request, fields=None):
+    """
+    Представление страницы рецептов для авторизованного пользователя.
+    Общая для всех часть рецепта берется из кеша фрагментов
+    (недостающие сериализуются одним набором запросов), флаги
+    пользователя выбираются одним запросом для всей страницы.
+    recipes — объекты с загруженными id и author_id, fields — выводимые
+    поля (см. get_sparse_fields) или None для всех полей.
+    """
+    recipe_ids = [recipe.id for recipe in recipes]
+    cache = caches['responses']
+    keys = get_fragment_keys(request, recipes)
+    cached = cache.get_many(keys.values())
+    fragments = {
+        recipe_id: cached[key]
+        for recipe_id, key in keys.items() if key in cached
+    }
+    missing = [
+        recipe_id for recipe_id in recipe_ids if recipe_id not in fragments
+    ]
+    if missing:
+        rendered = render_fragments(missing, request)
+        cache.set_many(
+            {keys[recipe_id]: rendered[recipe_id] for recipe_id in rendered},
+            settings.RECIPE_FRAGMENT_CACHE_TIMEOUT
+        )
+        fragments.update(rendered)
+
+    user = request.user
+    flags = get_viewer_flags(
+        user, recipe_ids, {recipe.author_id for recipe in recipes}
+    )
+    data = []
+    for recipe in recipes:
+        fragment = fragments.get(recipe.id)
+        if fragment is None:
+            # Рецепт удален после выбора страницы
+            continue
+        author = fragment['author']
+        item = {
+            **fragment,
+            'author': {
+                **author,
+                'is_subscribed': (
+                    author['id'] != user.id
+                    and author['id'] in flags['subscription']
+                ),
+            },
+            'is_favorited': recipe.id in flags['favorite'],
+            'is_in_shopping_cart': recipe.id in flags['cart'],
+        }
+        if fields is not None:
+            item = {
+                name: value for name, value in item.items() if name in fields
+            }
+        data.append(item)
+    return data
@@ -0,0 +1,425 @@
+import base64
+import binascii
+import logging
+import posixpath
+import uuid
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+import filetype
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.db.models.fields.json import KeyTextTransform
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from recipes.models import CustomUser, Recipe
+
+from .authentication import invalidate_user_tokens_on_commit
+from .versions import (bump_model_version_on_commit,
+                       bump_object_versions_on_commit)
+
+logger = logging.getLogger(__name__)
+
+# Копия изображения: имя, наибольшие ширина и высота и нужно ли
+# обрезать изображение до этого размера (иначе сохраняются пропорции)
+Rendition = namedtuple('Rendition', ('name', 'size', 'crop'))
+
+# Форматы копий: расширение, формат Pillow и параметры сохранения.
+# WebP меньше, JPEG — для клиентов без поддержки WebP
+RENDITION_FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+RENDITIONS_DIR = 'renditions'
+
+# Допустимые типы загружаемых изображений
+ALLOWED_IMAGE_TYPES = ('jpeg', 'png', 'gif')
+# Сколько первых байт файла достаточно, чтобы определить тип по сигнатуре
+IMAGE_HEADER_BYTES = 48
+# Длина блока base64 при декодировании, кратна 4 (48 КБ после декодирования)
+BASE64_CHUNK_LENGTH = 64 * 1024
+DATA_URI_BASE64 = ';base64,'
+# Переносы строк и пробелы, которые некоторые клиенты вставляют в base64
+BASE64_WHITESPACE = ' \t\r\n'
+
+# Модель: поле изображения и его копии
+IMAGE_RENDITIONS = {
+    Recipe: ('image', (
+        Rendition('card', (480, 480), False),
+        Rendition('detail', (1280, 1280), False),
+    )),
+    CustomUser: ('avatar', (
+        Rendition('avatar', (192, 192), True),
+    )),
+}
+
+
+class ImageUploadError(ValueError):
+    """Загруженный файл не является допустимым изображением."""
+
+
+def get_image_type(header):
+    """Тип изображения по сигнатуре в первых байтах файла."""
+    kind = filetype.image_match(header)
+    file_type = kind.extension if kind else None
+    if file_type == 'jpg':
+        file_type = 'jpeg'
+    if file_type not in ALLOWED_IMAGE_TYPES:
+        raise ImageUploadError(
+            f'Недопустимый тип файла: {file_type or "неизвестен"}'
+        )
+    return file_type
+
+
+def check_image_size(size):
+    """Проверяет размер файла изображения в байтах."""
+    if size > settings.IMAGE_UPLOAD_MAX_BYTES:
+        raise ImageUploadError(
+            'Размер изображения больше '
+            f'{filesizeformat(settings.IMAGE_UPLOAD_MAX_BYTES)}.'
+        )
+
+
+def check_image_pixels(file):
+    """
+    Проверяет число пикселей по размерам из заголовка изображения,
+    не декодируя пиксели, — защита от декомпрессионных бомб.
+    """
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+        raise ImageUploadError('Не удалось определить тип файла!')
+    finally:
+        file.seek(0)
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise ImageUploadError(
+            f'Изображение {width}×{height} слишком большое: допускается '
+            f'не больше {settings.IMAGE_UPLOAD_MAX_PIXELS} пикселей.'
+        )
+
+
+def decode_base64_image(data):
+    """
+    Декодирует изображение в формате data URI блоками во временный файл,
+    который до FILE_UPLOAD_MAX_MEMORY_SIZE хранится в памяти. Размер
+    проверяется до декодирования, тип — по первому блоку, число
+    пикселей — по заголовку. Возвращает UploadedFile с новым именем.
+    """
+    # Строка base64 не копируется целиком: блоки берутся срезами data
+    position = data.find(DATA_URI_BASE64)
+    if position < 0:
+        raise ImageUploadError(
+            'Изображение должно быть в формате data URI (base64).'
+        )
+    ext = data[:position].split('/')[-1].lower()
+    if ext == 'jpg':
+        ext = 'jpeg'
+    offset = position + len(DATA_URI_BASE64)
+    # Блоки должны содержать целые группы по 4 символа, поэтому
+    # пробельные символы удаляются до декодирования
+    if any(char in data for char in BASE64_WHITESPACE):
+        data = ''.join(data[offset:].split())
+        offset = 0
+    size = (len(data) - offset) // 4 * 3 - data[-2:].count('=')
+    check_image_size(size)
+
+    file = SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    file_type = None
+    for start in range(offset, len(data), BASE64_CHUNK_LENGTH):
+        try:
+            chunk = base64.b64decode(
+                data[start:start + BASE64_CHUNK_LENGTH], validate=True
+            )
+        except binascii.Error:
+            file.close()
+            raise ImageUploadError('Некорректная строка base64.')
+        if file_type is None:
+            file_type = get_image_type(chunk[:IMAGE_HEADER_BYTES])
+            if file_type != ext:
+                file.close()
+                raise ImageUploadError(
+                    f'Тип содержимого ({file_type}) не соответствует '
+                    f'расширению ({ext})!'
+                )
+        file.write(chunk)
+    if file_type is None:
+        raise ImageUploadError('Недопустимый тип файла: неизвестен')
+    file.seek(0)
+    check_image_pixels(file)
+    return UploadedFile(
+        file,
+        name=f'{uuid.uuid4()}.{file_type}',
+        content_type=f'image/{file_type}',
+        size=size
+    )
+
+
+def validate_uploaded_image(file):
+    """
+    Проверяет изображение, загруженное как multipart/form-data,
+    и назначает ему новое имя с расширением по типу содержимого.
+    """
+    check_image_size(file.size)
+    file_type = get_image_type(file.read(IMAGE_HEADER_BYTES))
+    file.seek(0)
+    check_image_pixels(file)
+    file.name = f'{uuid.uuid4()}.{file_type}'
+    file.content_type = f'image/{file_type}'
+    return file
+
+
+def get_renditions_field(field):
+    """Поле модели, в котором хранятся пути к копиям изображения."""
+    return f'{field}_renditions'
+
+
+def get_rendition_path(source, rendition, extension):
+    """Путь копии в хранилище; он определяется именем исходного файла."""
+    return posixpath.join(
+        RENDITIONS_DIR,
+        posixpath.splitext(source)[0],
+        f'{rendition.name}.{extension}'
+    )
+
+
+def get_renditions(instance, field):
+    """
+    Пути к копиям изображения объекта: {копия: {расширение: путь}}.
+    None, если изображения нет или копии для него еще не готовы.
+    """
+    source = getattr(instance, field).name
+    renditions = getattr(instance, get_renditions_field(field))
+    if not source or renditions.get('source') != source:
+        return None
+    return renditions['paths']
+
+
+def convert_for_format(image, image_format):
+    """JPEG не поддерживает прозрачность: фон заливается белым."""
+    if image_format == 'JPEG' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image
+
+
+def render_renditions(storage, source, renditions, force=False):
+    """
+    Создает копии изображения source из хранилища storage и возвращает
+    {копия: {расширение: путь}}. Готовые копии пропускаются без force:
+    одинаковые исходные файлы (например, при seed_load) обрабатываются
+    один раз.
+    """
+    paths = {
+        rendition.name: {
+            extension: get_rendition_path(source, rendition, extension)
+            for extension, _, _ in RENDITION_FORMATS
+        }
+        for rendition in renditions
+    }
+    if not force and all(
+        default_storage.exists(path)
+        for formats in paths.values() for path in formats.values()
+    ):
+        return paths
+
+    with storage.open(source) as file:
+        image = Image.open(file)
+        # JPEG декодируется сразу в уменьшенном масштабе
+        image.draft('RGB', max(rendition.size for rendition in renditions))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            # Палитру и оттенки серого уменьшать без потери качества
+            # можно только в полноцветном режиме
+            image = image.convert('RGBA')
+        for rendition in renditions:
+            if rendition.crop:
+                resized = ImageOps.fit(image, rendition.size, Image.LANCZOS)
+            else:
+                resized = image.copy()
+                resized.thumbnail(rendition.size, Image.LANCZOS)
+            for extension, image_format, options in RENDITION_FORMATS:
+                buffer = BytesIO()
+                convert_for_format(resized, image_format).save(
+                    buffer, image_format, **options
+                )
+                path = paths[rendition.name][extension]
+                if default_storage.exists(path):
+                    default_storage.delete(path)
+                default_storage.save(path, ContentFile(buffer.getvalue()))
+    return paths
+
+
+def process_source(model, source, force=False):
+    """
+    Создает копии изображения и сохраняет пути в объектах модели
+    с этим изображением. Объекты, изображение которых успели заменить,
+    не обновляются. Возвращает количество обновленных объектов.
+    """
+    field, renditions = IMAGE_RENDITIONS[model]
+    paths = render_renditions(
+        model._meta.get_field(field).storage, source, renditions, force
+    )
+    with transaction.atomic():
+        pks = list(
+            model.objects.filter(**{field: source})
+            .values_list('pk', flat=True)
+        )
+        model.objects.filter(**{field: source}).update(**{
+            get_renditions_field(field): {'source': source, 'paths': paths}
+        })
+        # Фрагменты рецептов зависят от версий рецепта и автора, а кеш
+        # ответов — от версии модели рецептов. Копии аватара его
+        # не сбрасывают: аватар выводится и без копий, а его замену
+        # учитывает сигнал author_changed
+        if model is Recipe:
+            bump_model_version_on_commit(Recipe)
+        bump_object_versions_on_commit(model, pks)
+        if model is CustomUser:
+            # update() не отправляет сигналов, а пользователь
+            # хранится в кеше токенов вместе с копиями аватара
+            for pk in pks:
+                invalidate_user_tokens_on_commit(pk)
+    return len(pks)
+
+
+def run_renditions(model, source):
+    """Задача пула: ошибки записываются в лог, соединение с БД закрывается."""
+    try:
+        process_source(model, source)
+    except Exception:
+        logger.exception('Не удалось создать копии изображения %s', source)
+    finally:
+        connection.close()
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_RENDITION_WORKERS,
+            thread_name_prefix='renditions'
+        )
+    return _executor
+
+
+def schedule_renditions(instance):
+    """
+    Ставит создание копий изображения объекта в пул потоков после
+    фиксации транзакции, чтобы не задерживать ответ. При
+    IMAGE_RENDITION_WORKERS=0 копии создает только команда
+    process_image_renditions.
+    """
+    model = type(instance)
+    field, _ = IMAGE_RENDITIONS[model]
+    source = getattr(instance, field).name
+    if not source or not settings.IMAGE_RENDITION_WORKERS:
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(run_renditions, model, source)
+    )
+
+
+def get_pending_sources(model, force=False):
+    """Изображения модели, для которых нет актуальных копий."""
+    field, _ = IMAGE_RENDITIONS[model]
+    queryset = model.objects.exclude(**{field: ''}).exclude(
+        **{f'{field}__isnull': True}
+    )
+    if not force:
+        queryset = queryset.annotate(
+            renditions_source=KeyTextTransform(
+                'source', get_renditions_field(field)
+            )
+        ).filter(
+            Q(renditions_source__isnull=True)
+            | ~Q(renditions_source=F(field))
+        )
+    return queryset.values_list(field, flat=True).distinct().order_by()
+
+
+def process_pending_renditions(force=False):
+    """
+    Создает недостающие копии изображений всех моделей.
+    Возвращает словарь {модель: количество обновленных объектов}.
+    """
+    updated = {}
+    for model in IMAGE_RENDITIONS:
+        updated[model] = 0
+        # Изображения выбираются заранее: обработка меняет выборку
+        for source in list(get_pending_sources(model, force)):
+            try:
+                updated[model] += process_source(model, source, force)
+            except (OSError, Image.DecompressionBombError):
+                logger.exception(
+                    'Не удалось создать копии изображения %s', source
+                )
+    return updated
+
+
+def iter_storage_files(storage, path):
+    """Пути всех файлов каталога хранилища, включая вложенные."""
+    if not storage.exists(path):
+        return
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield posixpath.join(path, name)
+    for directory in directories:
+        yield from iter_storage_files(storage, posixpath.join(path, directory))
+
+
+def get_media_references():
+    """Число объектов, ссылающихся на каждый файл изображения."""
+    references = Counter()
+    for model, (field, _) in IMAGE_RENDITIONS.items():
+        references.update(dict(
+            model.objects.exclude(**{field: ''})
+            .exclude(**{f'{field}__isnull': True})
+            .values_list(field).annotate(Count('pk')).order_by()
+        ))
+    return references
+
+
+def collect_media_garbage(min_age, dry_run=False):
+    """
+    Удаляет изображения, на которые не ссылается ни один объект,
+    и их уменьшенные копии. Файлы, записанные или повторно загруженные
+    позже чем min_age (timedelta) назад, не удаляются: объект со ссылкой
+    на них может быть еще не сохранен. Возвращает статистику.
+    """
+    references = get_media_references()
+    referenced_stems = {posixpath.splitext(name)[0] for name in references}
+    threshold = timezone.now() - min_age
+    stats = Counter(referenced=len(references))
+
+    def collect(storage, path, is_referenced):
+        stats['files'] += 1
+        if is_referenced or storage.get_modified_time(path) > threshold:
+            return
+        stats['deleted'] += 1
+        stats['freed_bytes'] += storage.size(path)
+        if not dry_run:
+            storage.delete(path)
+
+    for model, (field, _) in IMAGE_RENDITIONS.items():
+        model_field = model._meta.get_field(field)
+        storage = model_field.storage
+        for path in iter_storage_files(storage, model_field.upload_to):
+            collect(storage, path, path in references)
+    for path in iter_storage_files(default_storage, RENDITIONS_DIR):
+        stem = posixpath.relpath(posixpath.dirname(path), RENDITIONS_DIR)
+        collect(default_storage, path, stem in referenced_stems)
+    return stats
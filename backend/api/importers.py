@@ -0,0 +1,187 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.db.models import Q
+
+from .catalogue import invalidate_ingredient_index
+from recipes.models import CustomUser, Ingredient
+
+# Количество строк, которое читается из файла и пишется в базу за раз
+IMPORT_BATCH_SIZE = 1000
+# Размер блока, которым читается JSON-файл
+JSON_READ_SIZE = 64 * 1024
+
+INGREDIENT_FIELDS = ('name', 'measurement_unit')
+USER_FIELDS = ('first_name', 'last_name', 'username', 'email', 'password')
+
+
+def iter_chunks(iterable, size):
+    """Разбивает итерируемый объект на списки длиной не более size."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_json_array(file, read_size=JSON_READ_SIZE):
+    """
+    Построчно разбирает JSON-массив объектов, читая файл блоками,
+    чтобы не загружать весь файл в память.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        block = file.read(read_size)
+        buffer += block
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started:
+                if position == len(buffer):
+                    break
+                if buffer[position] != '[':
+                    raise ValueError('Ожидался JSON-массив объектов.')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if block:
+                    # Объект прочитан не полностью, дочитываем файл
+                    break
+                if position == len(buffer):
+                    raise ValueError('Незавершенный JSON-массив.')
+                raise
+            yield item
+        if not block:
+            return
+        buffer = buffer[position:]
+
+
+def read_rows(file_path, fields):
+    """
+    Читает записи из CSV (без заголовка, колонки в порядке fields)
+    или JSON-файла (массив объектов) и возвращает словари с полями fields.
+    """
+    file_path = Path(file_path)
+    with open(file_path, encoding='utf-8') as file:
+        if file_path.suffix.lower() == '.json':
+            rows = (
+                {field: item[field] for field in fields}
+                for item in iter_json_array(file)
+            )
+        else:
+            rows = (
+                dict(zip(fields, row)) for row in csv.reader(file) if row
+            )
+        for row in rows:
+            yield {
+                field: str(value).strip() for field, value in row.items()
+            }
+
+
+class ImportStats:
+    """Счетчики импорта: прочитанные и добавленные строки, скорость."""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0
+
+    def __str__(self):
+        return (
+            f'прочитано строк: {self.rows}, добавлено: {self.created}, '
+            f'время: {self.elapsed:.2f} с, {self.rows_per_second:.0f} строк/с'
+        )
+
+
+def import_ingredients(file_path, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Загружает ингредиенты из CSV- или JSON-файла пачками.
+    Уже существующие пары (name, measurement_unit) пропускаются.
+    """
+    stats = ImportStats()
+    count_before = Ingredient.objects.count()
+    for chunk in iter_chunks(read_rows(file_path, INGREDIENT_FIELDS),
+                             batch_size):
+        stats.rows += len(chunk)
+        Ingredient.objects.bulk_create(
+            [Ingredient(**row) for row in chunk], ignore_conflicts=True
+        )
+    stats.created = Ingredient.objects.count() - count_before
+    if stats.created:
+        # bulk_create не отправляет сигналы post_save
+        invalidate_ingredient_index()
+    return stats
+
+
+def import_users(file_path, batch_size=IMPORT_BATCH_SIZE, workers=None):
+    """
+    Загружает пользователей из CSV- или JSON-файла пачками.
+    Email и username нормализуются так же, как в create_user.
+    Пользователи с уже занятыми username или email пропускаются,
+    пароли новых пользователей хешируются параллельно в пуле процессов.
+    """
+    stats = ImportStats()
+    workers = workers or os.cpu_count() or 1
+    count_before = CustomUser.objects.count()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in iter_chunks(read_rows(file_path, USER_FIELDS),
+                                 batch_size):
+            stats.rows += len(chunk)
+            # Как в UserManager.create_user, иначе импортированные
+            # пользователи не совпадут с созданными через API
+            for row in chunk:
+                row['email'] = CustomUser.objects.normalize_email(
+                    row['email']
+                )
+                row['username'] = CustomUser.normalize_username(
+                    row['username']
+                )
+            usernames = [row['username'] for row in chunk]
+            emails = [row['email'] for row in chunk]
+            existing = set()
+            for username, email in CustomUser.objects.filter(
+                Q(username__in=usernames) | Q(email__in=emails)
+            ).values_list('username', 'email'):
+                existing.update((username, email))
+            new_rows = [
+                row for row in chunk
+                if row['username'] not in existing
+                and row['email'] not in existing
+            ]
+            passwords = executor.map(
+                make_password,
+                [row.pop('password') for row in new_rows],
+                chunksize=max(1, len(new_rows) // (workers * 4))
+            )
+            CustomUser.objects.bulk_create(
+                [
+                    CustomUser(**row, password=password)
+                    for row, password in zip(new_rows, passwords)
+                ],
+                ignore_conflicts=True
+            )
+    stats.created = CustomUser.objects.count() - count_before
+    return stats
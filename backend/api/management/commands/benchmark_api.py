@@ -0,0 +1,119 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.management.profiling import (benchmark_endpoint, get_api_client,
+                                      get_canonical_endpoints,
+                                      get_sample_user)
+from recipes.models import (CustomUser, Favorite, Ingredient, Recipe,
+                            ShoppingCart, Subscription)
+
+REPORT_MODELS = (
+    CustomUser, Recipe, Ingredient, Favorite, ShoppingCart, Subscription
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержки (p50/p95/p99), число SQL-запросов и пропускную '
+        'способность основных эндпоинтов API и выводит отчет в JSON. '
+        'С --compare сравнивает отчет с сохраненным ранее.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=30,
+            help='Количество замеряемых запросов к каждому эндпоинту.'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=3,
+            help='Количество прогревочных запросов.'
+        )
+        parser.add_argument(
+            '--endpoint',
+            action='append',
+            dest='endpoints',
+            help='Эндпоинт для замера (можно указать несколько раз).'
+        )
+        parser.add_argument(
+            '--anonymous',
+            action='store_true',
+            help='Выполнять запросы без авторизации.'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для отчета; по умолчанию отчет выводится в stdout.'
+        )
+        parser.add_argument(
+            '--compare',
+            help='Отчет предыдущего запуска для сравнения.'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=20,
+            help='Допустимый рост p95 в процентах при сравнении.'
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должно быть больше нуля.')
+
+        user = None if options['anonymous'] else get_sample_user()
+        client = get_api_client(user)
+        report = {
+            'database': connection.vendor,
+            'user': user.id if user else None,
+            'iterations': options['iterations'],
+            'rows': {
+                model.__name__: model.objects.count()
+                for model in REPORT_MODELS
+            },
+            'endpoints': {
+                url: benchmark_endpoint(
+                    client, url, options['iterations'], options['warmup']
+                )
+                for url in options['endpoints'] or get_canonical_endpoints()
+            },
+        }
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            self.compare(report, options['compare'], options['threshold'])
+
+    def compare(self, report, path, threshold):
+        """Сравнивает отчет с предыдущим и сообщает о регрессиях."""
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)['endpoints']
+        regressions = 0
+        for url, result in report['endpoints'].items():
+            previous = baseline.get(url)
+            if previous is None:
+                continue
+            change = (
+                (result['p95_ms'] - previous['p95_ms'])
+                / previous['p95_ms'] * 100 if previous['p95_ms'] else 0
+            )
+            line = (
+                f'{url}: p95 {previous["p95_ms"]} -> {result["p95_ms"]} мс '
+                f'({change:+.0f}%), запросов {previous["queries"]} -> '
+                f'{result["queries"]}'
+            )
+            if change > threshold or result['queries'] > previous['queries']:
+                regressions += 1
+                self.stderr.write(self.style.WARNING(line))
+            else:
+                self.stderr.write(line)
+        if regressions:
+            raise CommandError(f'Регрессий производительности: {regressions}')
@@ -0,0 +1,133 @@
+import json
+import logging
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.management.profiling import get_api_client, read_response
+from api.renderers import FastJSONParser, FastJSONRenderer, orjson
+
+PAGE_URL = '/api/recipes/?limit={limit}'
+SPARSE_FIELDS = 'id,name,image,cooking_time,author'
+
+
+def measure(function, iterations):
+    """Процессорное время одного вызова function в миллисекундах."""
+    started = time.process_time()
+    for _ in range(iterations):
+        function()
+    return round((time.process_time() - started) / iterations * 1000, 3)
+
+
+def compare(baseline, optimized):
+    """Результат сравнения двух замеров."""
+    return {
+        'baseline_ms': baseline,
+        'optimized_ms': optimized,
+        'saved_percent': (
+            round((baseline - optimized) / baseline * 100, 1)
+            if baseline else 0
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает процессорное время сериализации страницы рецептов: '
+        'JSONRenderer и FastJSONRenderer, JSONParser и FastJSONParser, '
+        'полный ответ и ответ с параметром fields. Отчет выводится в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+            help='Количество повторов каждого замера.'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=100,
+            help='Количество рецептов на странице.'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для отчета; по умолчанию отчет выводится в stdout.'
+        )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        if iterations < 1:
+            raise CommandError('--iterations должно быть больше нуля.')
+
+        url = PAGE_URL.format(limit=options['limit'])
+        client = get_api_client()
+        # Строки лога каждого запроса здесь не нужны
+        logging.disable(logging.INFO)
+        try:
+            report = self.collect_report(client, url, iterations)
+        finally:
+            logging.disable(logging.NOTSET)
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    def collect_report(self, client, url, iterations):
+        """Замеры рендеринга, разбора и ответов API для страницы url."""
+        # Замеряется сериализация, а не кеш ответов
+        with override_settings(
+            RECIPE_RESPONSE_CACHE=False, ALLOWED_HOSTS=['testserver']
+        ):
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(
+                    f'{url}: неожиданный статус {response.status_code}'
+                )
+            data = response.data
+            content = JSONRenderer().render(data)
+            sparse_url = f'{url}&fields={SPARSE_FIELDS}'
+            report = {
+                'orjson': orjson is not None,
+                'recipes': len(data['results']),
+                'iterations': iterations,
+                'content_bytes': len(content),
+                'render': compare(
+                    measure(lambda: JSONRenderer().render(data), iterations),
+                    measure(
+                        lambda: FastJSONRenderer().render(data), iterations
+                    )
+                ),
+                'parse': compare(
+                    measure(
+                        lambda: JSONParser().parse(BytesIO(content)),
+                        iterations
+                    ),
+                    measure(
+                        lambda: FastJSONParser().parse(BytesIO(content)),
+                        iterations
+                    )
+                ),
+                'sparse_fields': SPARSE_FIELDS,
+                'sparse_content_bytes': len(
+                    read_response(client.get(sparse_url))
+                ),
+                'response': compare(
+                    measure(
+                        lambda: read_response(client.get(url)), iterations
+                    ),
+                    measure(
+                        lambda: read_response(client.get(sparse_url)),
+                        iterations
+                    )
+                ),
+            }
+        return report
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from api.images import collect_media_garbage
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет изображения рецептов и аватары, на которые не ссылается '
+        'ни один объект, и их уменьшенные копии. Запускается по '
+        'расписанию, например раз в сутки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age-hours',
+            type=float,
+            default=24,
+            help=(
+                'Не удалять файлы, записанные или повторно загруженные '
+                'позже этого срока.'
+            )
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, сколько файлов будет удалено.'
+        )
+
+    def handle(self, *args, **options):
+        stats = collect_media_garbage(
+            timedelta(hours=options['min_age_hours']), options['dry_run']
+        )
+        action = 'будет удалено' if options['dry_run'] else 'удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов: {stats["files"]}, используемых изображений: '
+            f'{stats["referenced"]}, {action}: {stats["deleted"]} '
+            f'({filesizeformat(stats["freed_bytes"])}).'
+        ))
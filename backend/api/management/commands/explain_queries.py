@@ -0,0 +1,98 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from api.management.profiling import (capture_endpoint_queries,
+                                      get_api_client,
+                                      get_canonical_endpoints,
+                                      get_sample_user)
+
+
+def find_seq_scans(plan):
+    """
+    Возвращает последовательные сканирования из плана EXPLAIN ANALYZE
+    в виде (таблица, число просмотренных строк).
+    """
+    scans = []
+    if plan['Node Type'] == 'Seq Scan':
+        rows = (
+            plan.get('Actual Rows', 0) + plan.get('Rows Removed by Filter', 0)
+        ) * plan.get('Actual Loops', 1)
+        scans.append((plan['Relation Name'], rows))
+    for child in plan.get('Plans', []):
+        scans.extend(find_seq_scans(child))
+    return scans
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN ANALYZE для SQL-запросов основных эндпоинтов API '
+        'и завершается с ошибкой, если какой-либо запрос последовательно '
+        'сканирует больше --max-seq-rows строк. Запускать на заполненной '
+        'базе (см. seed_load).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-seq-rows',
+            type=int,
+            default=1000,
+            help='Допустимое число строк в последовательном сканировании.'
+        )
+        parser.add_argument(
+            '--include-counts',
+            action='store_true',
+            help='Проверять и запросы SELECT COUNT(*) пагинации.'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Команда поддерживает только PostgreSQL.')
+
+        client = get_api_client(get_sample_user())
+        seen, violations = set(), []
+        # Поиск ингредиентов проверяется по базе, а не по индексу в памяти
+        with override_settings(INGREDIENT_CATALOGUE_CACHE=False):
+            for url in get_canonical_endpoints():
+                response, queries = capture_endpoint_queries(client, url)
+                self.stdout.write(
+                    f'{url}: {response.status_code}, запросов: {len(queries)}'
+                )
+                for query in queries:
+                    sql = query['sql']
+                    if not sql.startswith('SELECT') or sql in seen:
+                        continue
+                    seen.add(sql)
+                    if (sql.startswith('SELECT COUNT(*)')
+                            and not options['include_counts']):
+                        continue
+                    violations.extend(
+                        (url, table, rows, sql)
+                        for table, rows in self.explain(sql)
+                        if rows > options['max_seq_rows']
+                    )
+
+        for url, table, rows, sql in violations:
+            self.stdout.write(self.style.WARNING(
+                f'{url}: Seq Scan по {table}, строк: {rows}\n    {sql}'
+            ))
+        if violations:
+            raise CommandError(
+                f'Последовательных сканирований сверх порога: '
+                f'{len(violations)}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено запросов: {len(seen)}, последовательных '
+            f'сканирований сверх порога нет.'
+        ))
+
+    def explain(self, sql):
+        """Последовательные сканирования в плане запроса."""
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}')
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return find_seq_scans(plan[0]['Plan'])
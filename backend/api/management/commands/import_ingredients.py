@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.importers import IMPORT_BATCH_SIZE, import_ingredients
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV- или JSON-файла.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=settings.BASE_DIR.parent / 'data' / 'ingredients.csv',
+            help='Путь к файлу .csv (name,measurement_unit) или .json.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help='Количество строк в одной пачке.'
+        )
+
+    def handle(self, *args, **options):
+        stats = import_ingredients(options['path'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Ингредиенты: {stats}'))
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.importers import IMPORT_BATCH_SIZE, import_users
+
+
+class Command(BaseCommand):
+    help = 'Загружает пользователей из CSV- или JSON-файла.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=settings.BASE_DIR.parent / 'data' / 'users.csv',
+            help=(
+                'Путь к файлу .csv (first_name,last_name,username,email,'
+                'password) или .json.'
+            )
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help='Количество строк в одной пачке.'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Количество процессов для хеширования паролей.'
+        )
+
+    def handle(self, *args, **options):
+        stats = import_users(
+            options['path'], options['batch_size'], options['workers']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Пользователи: {stats}'))
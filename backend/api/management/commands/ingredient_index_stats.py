@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.catalogue import measure_ingredient_index
+from api.search import MIN_CONTAINS_LENGTH
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит индекс справочника ингредиентов и выводит время построения, '
+        'объем памяти и время поиска.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'terms',
+            nargs='*',
+            default=['а', 'сол', 'сок'],
+            help='Запросы для замера времени поиска.'
+        )
+
+    def handle(self, *args, **options):
+        index, build_time = measure_ingredient_index()
+        self.stdout.write(
+            f'Ингредиентов в индексе: {len(index)}\n'
+            f'Время построения: {build_time * 1000:.1f} мс\n'
+            f'Объем памяти: {index.memory_size() / 1024:.0f} КБ'
+        )
+        for term in options['terms']:
+            started = time.perf_counter()
+            found = index.find(term, MIN_CONTAINS_LENGTH)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'Поиск "{term}": {len(found)} результатов, '
+                f'{elapsed * 1000:.3f} мс'
+            )
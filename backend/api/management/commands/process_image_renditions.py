@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.images import process_pending_renditions
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает уменьшенные копии изображений рецептов и аватаров, '
+        'для которых их еще нет: после обновления, при '
+        'IMAGE_RENDITION_WORKERS=0 или если фоновая задача не выполнилась.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать копии всех изображений.'
+        )
+
+    def handle(self, *args, **options):
+        updated = process_pending_renditions(force=options['force'])
+        counts = ', '.join(
+            f'{model.__name__} {count}' for model, count in updated.items()
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Копии изображений сохранены: {counts}.'
+        ))
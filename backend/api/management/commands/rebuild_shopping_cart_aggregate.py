@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.utils import calculate_shopping_cart_totals
+from recipes.models import ShoppingCartAggregate
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет суммы списков покупок (ShoppingCartAggregate) '
+        'с рецептами в корзинах и перестраивает их.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help='Только проверить суммы, не изменяя их.'
+        )
+
+    def handle(self, *args, **options):
+        expected = calculate_shopping_cart_totals()
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in
+            ShoppingCartAggregate.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ).iterator()
+        }
+        mismatched = {
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        }
+        for user_id, ingredient_id in sorted(mismatched):
+            self.stdout.write(
+                f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'ожидалось {expected.get((user_id, ingredient_id), 0)}, '
+                f'сохранено {stored.get((user_id, ingredient_id), 0)}'
+            )
+
+        if options['verify_only']:
+            if mismatched:
+                raise CommandError(
+                    f'Расхождений в суммах списков покупок: {len(mismatched)}'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'Суммы списков покупок верны ({len(stored)} строк).'
+            ))
+            return
+
+        with transaction.atomic():
+            ShoppingCartAggregate.objects.all().delete()
+            ShoppingCartAggregate.objects.bulk_create(
+                [
+                    ShoppingCartAggregate(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount
+                    )
+                    for (user_id, ingredient_id), amount in expected.items()
+                ],
+                batch_size=1000
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Суммы списков покупок перестроены: {len(expected)} строк, '
+            f'исправлено расхождений: {len(mismatched)}.'
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.importers import IMPORT_BATCH_SIZE
+from api.timeline import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет ленты подписок (/api/recipes/feed/) последними '
+        'рецептами авторов по всем подпискам. Нужна после включения '
+        'ленты на существующих данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help='Количество подписок, обрабатываемых за раз.'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_timelines(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты подписок заполнены, подписок: {count}.'
+        ))
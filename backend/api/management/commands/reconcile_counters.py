@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.utils import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет денормализованные счетчики (избранное и списки покупок '
+        'рецептов, рецепты и подписчики пользователей) с исходными '
+        'таблицами и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help='Только проверить счетчики, не изменяя их.'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = reconcile_counters(options['verify_only'])
+        for counter, rows in drift.items():
+            self.stdout.write(f'{counter}: расхождений {rows}')
+
+        total = sum(drift.values())
+        if options['verify_only']:
+            if total:
+                raise CommandError(f'Расхождений в счетчиках: {total}')
+            self.stdout.write(self.style.SUCCESS('Счетчики верны.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики пересчитаны, исправлено строк: {total}.'
+        ))
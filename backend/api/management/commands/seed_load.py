@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+
+from api.importers import IMPORT_BATCH_SIZE
+from api.seeding import SEED_PASSWORD, seed_load
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует синтетических пользователей, рецепты, избранное, '
+        'списки покупок и подписки для нагрузочного тестирования.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=1000,
+            help='Количество пользователей.'
+        )
+        parser.add_argument(
+            '--recipes-per-user',
+            type=int,
+            default=5,
+            help='Среднее количество рецептов на пользователя.'
+        )
+        parser.add_argument(
+            '--favorites-per-user',
+            type=int,
+            default=20,
+            help='Среднее количество избранных рецептов.'
+        )
+        parser.add_argument(
+            '--carts-per-user',
+            type=int,
+            default=3,
+            help='Среднее количество рецептов в списке покупок.'
+        )
+        parser.add_argument(
+            '--subscriptions-per-user',
+            type=int,
+            default=10,
+            help='Среднее количество подписок.'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Начальное значение генератора случайных чисел.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help='Количество записей в одной пачке.'
+        )
+
+    def handle(self, *args, **options):
+        stats = seed_load(
+            options['users'],
+            recipes_per_user=options['recipes_per_user'],
+            favorites_per_user=options['favorites_per_user'],
+            carts_per_user=options['carts_per_user'],
+            subscriptions_per_user=options['subscriptions_per_user'],
+            seed=options['seed'],
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Создано: {stats}'))
+        self.stdout.write(f'Пароль пользователей: {SEED_PASSWORD}')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from api.importers import IMPORT_BATCH_SIZE
+from api.ranking import update_recipe_scores
+
+
+class Command(BaseCommand):
+    help = (
+        'Обновляет рейтинги рецептов для сортировки ленты '
+        '(ordering=popular|trending). Запускается по расписанию, '
+        'например cron раз в несколько минут.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help=(
+                'Пересчитать trending по всем событиям, учитывая удаления '
+                'из избранного и списков покупок.'
+            )
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help='Размер пачки при записи рейтингов.'
+        )
+
+    def handle(self, *args, **options):
+        stats = update_recipe_scores(options['full'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинги обновлены: новых {stats["created"]}, '
+            f'popular {stats["popular"]}, trending {stats["trending"]}.'
+        ))
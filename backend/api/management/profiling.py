@@ -0,0 +1,144 @@
+import math
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models import Count
+
+from api.metrics import LOGGED_SQL_LENGTH, QueryBudgetExceeded, QueryRecorder
+from recipes.models import CustomUser, Ingredient, Recipe, Tag
+
+# Основные запросы API; в фигурных скобках — идентификаторы из базы
+CANONICAL_ENDPOINTS = (
+    '/api/recipes/',
+    '/api/recipes/?limit=100',
+    '/api/recipes/?pagination=cursor&limit=100',
+    '/api/recipes/?tags={tag}',
+    '/api/recipes/?author={author}',
+    '/api/recipes/?is_favorited=1',
+    '/api/recipes/?is_in_shopping_cart=1',
+    '/api/recipes/{recipe}/',
+    '/api/recipes/download_shopping_cart/',
+    '/api/users/',
+    '/api/users/me/',
+    '/api/users/{author}/',
+    '/api/users/subscriptions/?recipes_limit=3',
+    '/api/tags/',
+    '/api/ingredients/?name={ingredient}',
+)
+
+
+def get_sample_user():
+    """Пользователь с наибольшим числом подписок, а при равенстве — первый."""
+    return CustomUser.objects.annotate(
+        subscriptions_count=Count('subscriptions')
+    ).order_by('-subscriptions_count', 'id').first()
+
+
+def get_canonical_endpoints():
+    """Подставляет в CANONICAL_ENDPOINTS идентификаторы из базы."""
+    recipe = Recipe.objects.order_by('-created_at').first()
+    tag = Tag.objects.order_by('id').first()
+    ingredient = Ingredient.objects.order_by('id').first()
+    values = {
+        'recipe': recipe.id if recipe else 0,
+        'author': recipe.author_id if recipe else 0,
+        'tag': tag.slug if tag else '',
+        'ingredient': ingredient.name[:3] if ingredient else '',
+    }
+    return [endpoint.format(**values) for endpoint in CANONICAL_ENDPOINTS]
+
+
+def get_api_client(user=None):
+    """
+    Тестовый клиент API, при необходимости авторизованный.
+    Инструменты тестов импортируются только при вызове из команд.
+    """
+    from rest_framework.test import APIClient
+
+    client = APIClient(raise_request_exception=False)
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+def read_response(response):
+    """Дочитывает ответ, в том числе потоковый, и возвращает тело."""
+    if getattr(response, 'streaming', False):
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+@contextmanager
+def query_budget(max_queries=None, max_repeats=None):
+    """
+    Проверяет, что внутри блока выполнено не больше max_queries
+    SQL-запросов и ни одна форма запроса не повторилась больше
+    max_repeats раз. Иначе выбрасывает QueryBudgetExceeded
+    (наследник AssertionError, поэтому подходит для тестов).
+
+        with query_budget(max_queries=5, max_repeats=1):
+            client.get('/api/recipes/')
+    """
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        yield recorder
+    if max_queries is not None and recorder.count > max_queries:
+        raise QueryBudgetExceeded(
+            f'Выполнено SQL-запросов: {recorder.count}, '
+            f'допустимо: {max_queries}'
+        )
+    shape, repeats = recorder.most_repeated()
+    if max_repeats is not None and repeats > max_repeats:
+        raise QueryBudgetExceeded(
+            f'Запрос выполнен {repeats} раз, допустимо {max_repeats}: '
+            f'{shape[:LOGGED_SQL_LENGTH]}'
+        )
+
+
+def capture_endpoint_queries(client, url):
+    """Выполняет GET-запрос и возвращает ответ и выполненные SQL-запросы."""
+    from django.test.utils import CaptureQueriesContext, override_settings
+
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+            read_response(response)
+    return response, context.captured_queries
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+def benchmark_endpoint(client, url, iterations, warmup=0):
+    """
+    Выполняет GET-запрос warmup + iterations раз и возвращает задержки
+    (p50/p95/p99 в миллисекундах), число SQL-запросов и пропускную
+    способность. Прогревочные запросы в статистику не входят.
+    """
+    for _ in range(warmup):
+        capture_endpoint_queries(client, url)
+    timings, query_counts, statuses = [], [], set()
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response, queries = capture_endpoint_queries(client, url)
+        timings.append((time.perf_counter() - started) * 1000)
+        query_counts.append(len(queries))
+        statuses.add(response.status_code)
+    total = sum(timings)
+    return {
+        'status': sorted(statuses),
+        'requests': iterations,
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'mean_ms': round(total / iterations, 2),
+        'queries': max(query_counts),
+        'requests_per_second': round(iterations / total * 1000, 1),
+    }
@@ -0,0 +1,213 @@
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+# Границы корзин гистограмм
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+# Длина SQL, попадающего в лог при обнаружении повторов
+LOGGED_SQL_LENGTH = 300
+# Списки плейсхолдеров (IN (%s, %s, ...)) сворачиваются, чтобы запросы
+# с разным числом параметров считались одной формой
+PLACEHOLDERS_RE = re.compile(r'%s(?:, %s)+')
+
+logger = logging.getLogger('api.queries')
+
+
+def get_query_shape(sql):
+    """Форма SQL-запроса: текст с плейсхолдерами, списки свернуты."""
+    return PLACEHOLDERS_RE.sub('%s, ...', sql)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Превышен бюджет SQL-запросов или допустимое число повторов."""
+
+
+class QueryRecorder:
+    """
+    Обертка выполнения SQL (connection.execute_wrapper): считает запросы,
+    их суммарное время и повторы одинаковых запросов — признак N+1.
+    Запросы сравниваются по форме (get_query_shape), без параметров.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        shape = get_query_shape(sql)
+        self.check(shape)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[shape] += 1
+
+    def check(self, shape):
+        """Вызывается перед выполнением запроса."""
+
+    @property
+    def duplicates(self):
+        """Количество запросов, повторяющих уже выполненные."""
+        return self.count - len(self.statements)
+
+    def most_repeated(self):
+        """Самый частый запрос и число его выполнений."""
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+class QueryGuard(QueryRecorder):
+    """
+    Следит, чтобы одна форма запроса выполнялась не больше max_repeats
+    раз. При превышении выбрасывает QueryBudgetExceeded или, если
+    raise_errors=False, пишет предупреждение со стеком вызова
+    в лог api.queries.
+    """
+
+    def __init__(self, max_repeats, raise_errors=True):
+        super().__init__()
+        self.max_repeats = max_repeats
+        self.raise_errors = raise_errors
+
+    def check(self, shape):
+        if self.statements[shape] < self.max_repeats:
+            return
+        message = (
+            f'Запрос выполняется больше {self.max_repeats} раз: '
+            f'{shape[:LOGGED_SQL_LENGTH]}'
+        )
+        if self.raise_errors:
+            raise QueryBudgetExceeded(message)
+        if self.statements[shape] == self.max_repeats:
+            logger.warning(message, stack_info=True)
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus: накопленные счетчики корзин."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        for bound, count in zip(bounds, self.counts):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{format_labels(labels, le=bound)} '
+                f'{cumulative}'
+            )
+        lines.append(f'{name}_sum{format_labels(labels)} {self.sum}')
+        lines.append(f'{name}_count{format_labels(labels)} {self.count}')
+        return lines
+
+
+def format_labels(labels, **extra):
+    """Метки метрики в синтаксисе Prometheus: {name="value",...}."""
+    labels = {**labels, **extra}
+    return '{' + ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n')
+        )
+        for name, value in labels.items()
+    ) + '}'
+
+
+class MetricsRegistry:
+    """
+    Метрики запросов по представлениям, накопленные в процессе.
+    Каждый процесс gunicorn хранит свои значения.
+    """
+
+    HISTOGRAMS = (
+        (
+            'foodgram_request_duration_seconds',
+            'Время обработки запроса.',
+            DURATION_BUCKETS
+        ),
+        (
+            'foodgram_db_duration_seconds',
+            'Суммарное время SQL-запросов за запрос.',
+            DURATION_BUCKETS
+        ),
+        (
+            'foodgram_db_queries',
+            'Количество SQL-запросов за запрос.',
+            QUERY_COUNT_BUCKETS
+        ),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.responses = Counter()
+        self.duplicates = Counter()
+
+    def observe(self, view, method, status, duration, db_duration,
+                queries, duplicates):
+        labels = (('view', view), ('method', method))
+        values = (duration, db_duration, queries)
+        with self.lock:
+            for (name, _, buckets), value in zip(self.HISTOGRAMS, values):
+                histogram = self.histograms.get((name, labels))
+                if histogram is None:
+                    histogram = self.histograms[name, labels] = Histogram(
+                        buckets
+                    )
+                histogram.observe(value)
+            self.responses[labels + (('status', status),)] += 1
+            self.duplicates[labels] += duplicates
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus."""
+        with self.lock:
+            lines = []
+            for name, help_text, _ in self.HISTOGRAMS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, labels), histogram in self.histograms.items():
+                    if metric == name:
+                        lines.extend(histogram.render(name, dict(labels)))
+            for name, help_text, counter in (
+                (
+                    'foodgram_responses_total',
+                    'Количество ответов.',
+                    self.responses
+                ),
+                (
+                    'foodgram_db_duplicate_queries_total',
+                    'Количество повторных SQL-запросов (признак N+1).',
+                    self.duplicates
+                ),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                lines.extend(
+                    f'{name}{format_labels(dict(labels))} {value}'
+                    for labels, value in counter.items()
+                )
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,153 @@
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .metrics import LOGGED_SQL_LENGTH, QueryGuard, QueryRecorder, registry
+
+logger = logging.getLogger('api.requests')
+
+
+class RequestMetrics:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = QueryRecorder()
+        self.view_started = None
+        self.view_finished = None
+        self.view_db_duration = 0.0
+
+    def start_view(self):
+        self.view_started = time.perf_counter()
+        self.view_db_duration = -self.queries.duration
+
+    def finish_view(self):
+        self.view_finished = time.perf_counter()
+        self.view_db_duration += self.queries.duration
+
+    def phases(self, finished):
+        """
+        Длительность этапов в секундах. view — время представления
+        без SQL: сериализация, проверка прав, хеширование пароля и другая
+        работа представления; render — рендеринг ответа.
+        Для ответов без отложенного рендеринга этапы не выделяются.
+        """
+        phases = {
+            'total': finished - self.started,
+            'db': self.queries.duration,
+        }
+        if self.view_started is not None and self.view_finished is not None:
+            phases['view'] = max(
+                0.0,
+                self.view_finished - self.view_started
+                - self.view_db_duration
+            )
+            phases['render'] = finished - self.view_finished
+        return phases
+
+
+class RequestMetricsMiddleware:
+    """
+    Учитывает для каждого запроса время обработки, количество и время
+    SQL-запросов, повторы запросов, время работы представления без SQL
+    и рендеринга ответа.
+    Результат отдается в заголовке Server-Timing, пишется в лог
+    api.requests одной JSON-строкой и накапливается в гистограммах
+    по представлениям (см. /api/_metrics).
+    SQL учитывается через connection.execute_wrapper, без DEBUG-курсора,
+    поэтому накладные расходы малы. Запросы потоковых ответов,
+    выполняемые после возврата ответа, не учитываются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = request.request_metrics = RequestMetrics()
+        with connection.execute_wrapper(metrics.queries):
+            response = self.get_response(request)
+        phases = metrics.phases(time.perf_counter())
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        queries = metrics.queries
+        registry.observe(
+            view, request.method, response.status_code, phases['total'],
+            phases['db'], queries.count, queries.duplicates
+        )
+        if settings.REQUEST_METRICS_SERVER_TIMING:
+            response['Server-Timing'] = self.server_timing(phases, queries)
+        self.log(request, response, view, phases, queries)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.request_metrics.start_view()
+
+    def process_template_response(self, request, response):
+        # Вызывается после представления и до рендеринга ответа DRF
+        request.request_metrics.finish_view()
+        return response
+
+    @staticmethod
+    def server_timing(phases, queries):
+        entries = []
+        for name, duration in phases.items():
+            entry = f'{name};dur={duration * 1000:.1f}'
+            if name == 'db':
+                entry += (
+                    f';desc="{queries.count} queries, '
+                    f'{queries.duplicates} duplicates"'
+                )
+            entries.append(entry)
+        return ', '.join(entries)
+
+    @staticmethod
+    def log(request, response, view, phases, queries):
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'db_queries': queries.count,
+            'db_duplicates': queries.duplicates,
+        }
+        record.update(
+            (f'{name}_ms', round(duration * 1000, 2))
+            for name, duration in phases.items()
+        )
+        if queries.duplicates:
+            sql, count = queries.most_repeated()
+            record['repeated_sql'] = sql[:LOGGED_SQL_LENGTH]
+            record['repeated_sql_count'] = count
+        logger.info(json.dumps(record, ensure_ascii=False))
+
+
+class QueryGuardMiddleware:
+    """
+    Режим для тестовых стендов: находит N+1, когда одна форма SQL-запроса
+    повторяется за запрос больше QUERY_GUARD_MAX_REPEATS раз.
+    QUERY_GUARD_MODE='raise' прерывает запрос ошибкой QueryBudgetExceeded,
+    'log' пишет предупреждение со стеком вызова, иначе middleware
+    отключается.
+    """
+
+    MODES = ('log', 'raise')
+
+    def __init__(self, get_response):
+        if settings.QUERY_GUARD_MODE not in self.MODES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        guard = QueryGuard(
+            settings.QUERY_GUARD_MAX_REPEATS,
+            raise_errors=settings.QUERY_GUARD_MODE == 'raise'
+        )
+        with connection.execute_wrapper(guard):
+            return self.get_response(request)
@@ -1,20 +1,144 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
+
+from .versions import get_model_version, get_model_versions
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы для справочников.
+    ETag и Last-Modified вычисляются по версии данных модели, поэтому
+    на If-None-Match/If-Modified-Since отвечаем 304 без сериализации.
+    Cache-Control позволяет кешировать ответы в nginx (proxy_cache).
+    """
+    cache_max_age = settings.CATALOGUE_CACHE_MAX_AGE
+
+    def get_conditional_etag(self, request, version):
+        """ETag зависит от версии данных, адреса и формата ответа."""
+        key = (
+            f'{version}:{request.get_full_path()}:'
+            f'{request.accepted_media_type}'
+        )
+        return f'"{hashlib.md5(key.encode()).hexdigest()}"'
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        """Возвращает 304 или ответ handler с заголовками кеширования."""
+        version = get_model_version(self.queryset.model)
+        etag = self.get_conditional_etag(request, version)
+        last_modified = version // 10 ** 9
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True, max_age=self.cache_max_age)
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+
+class AnonymousResponseCacheMixin:
+    """
+    Кеш отрендеренных ответов list и retrieve для анонимных
+    пользователей: флаги избранного и списка покупок у них всегда ложны,
+    поэтому ответ зависит только от адреса и параметров запроса.
+    Ответы хранятся в кеше responses под ключом с версиями данных
+    response_cache_models (см. api.signals), поэтому запись в эти модели
+    делает старые ключи недоступными.
+    """
+    response_cache_models = ()
+    # Параметры, влияющие на ответ анонимному пользователю, и параметры
+    # со списком значений, порядок которых не важен
+    response_cache_params = ()
+    response_cache_multi_params = ()
+
+    def get_response_cache_models(self, request):
+        return self.response_cache_models
+
+    def get_response_cache_key(self, request):
+        """Ключ кеша или None, если ответ не кешируется."""
+        if (not settings.RECIPE_RESPONSE_CACHE
+                or request.user.is_authenticated):
+            return None
+        params = []
+        for name in self.response_cache_params:
+            values = request.query_params.getlist(name)
+            if name in self.response_cache_multi_params:
+                values = sorted(set(values))
+            if values:
+                params.append(f'{name}={",".join(values)}')
+        versions = get_model_versions(self.get_response_cache_models(request))
+        key = (
+            f'{request.scheme}://{request.get_host()}{request.path}?'
+            f'{"&".join(params)}:{request.accepted_media_type}:{versions}'
+        )
+        return 'response:' + hashlib.md5(key.encode()).hexdigest()
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        """Отдает ответ из кеша или кеширует ответ handler после рендеринга."""
+        key = self.get_response_cache_key(request)
+        if key is None:
+            return handler(request, *args, **kwargs)
+        cache = caches['responses']
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response.add_post_render_callback(lambda rendered: cache.set(
+                key,
+                (rendered.content, rendered['Content-Type']),
+                settings.RECIPE_RESPONSE_CACHE_TIMEOUT
+            ))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+
 class IsSubscribedMixin:
     def get_is_subscribed(self, obj):
         """
         Проверяет:
         - подписан ли текущий пользователь на данного пользователя;
         - подписку на самого себя.
+        Если пользователь аннотирован флагом is_subscribed, запрос в базу
+        не выполняется.
         """
         request = self.context.get('request')
         if request and request.user.is_authenticated:
+            user = obj.author if hasattr(obj, 'author') else obj
             # Проверка на подписку на самого себя
-            if (obj.author == request.user if hasattr(obj, 'author')
-                    else obj == request.user):
+            if user == request.user:
                 return False
+            if hasattr(user, 'is_subscribed'):
+                return user.is_subscribed
             # Проверка на подписку на другого автора
-            return obj.author.subscriptions.filter(
-                follower=request.user
-            ).exists() if hasattr(obj, 'author') else obj.subscriptions.filter(
-                follower=request.user
-            ).exists()
+            return user.subscribers.filter(follower=request.user).exists()
         return False
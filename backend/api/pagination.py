@@ -1,5 +1,15 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class MainPagePagination(PageNumberPagination):
@@ -16,3 +26,190 @@ class MainPagePagination(PageNumberPagination):
             'previous': self.get_previous_link(),
             'results': data
         })
+
+
+def get_feed_count(queryset, mode):
+    """
+    Количество объектов для ответа с пагинацией.
+    mode: exact — COUNT(*); cached — COUNT(*), сохраненный в кеше на
+    RECIPE_FEED_COUNT_CACHE_TIMEOUT секунд; approximate — оценка
+    планировщика PostgreSQL для запроса без фильтров (в остальных
+    случаях — как cached).
+    """
+    if mode == 'approximate' and not queryset.query.where:
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class '
+                    'WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= 0:
+                return row[0]
+    if mode == 'exact':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    key = 'feed_count:' + hashlib.md5(
+        f'{sql}:{params}'.encode()
+    ).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.RECIPE_FEED_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class RecipeKeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация ленты рецептов по (created_at, id).
+    Страница выбирается условием по ключу последнего показанного рецепта
+    вместо OFFSET, поэтому дальние страницы не медленнее первой.
+    Формат ответа совпадает с MainPagePagination.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_page_size(self, request):
+        """Размер страницы из параметра limit."""
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, recipe, reverse):
+        """Курсор: направление и ключ (created_at, id) рецепта."""
+        value = f'{int(reverse)}|{recipe.created_at.isoformat()}|{recipe.id}'
+        return urlsafe_b64encode(value.encode()).decode()
+
+    def decode_cursor(self, request):
+        """Разбирает курсор из запроса: (reverse, created_at, id) или None."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            reverse, created_at, pk = urlsafe_b64decode(
+                encoded.encode()
+            ).decode().split('|')
+            return (
+                reverse == '1', datetime.fromisoformat(created_at), int(pk)
+            )
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def filter_by_cursor(self, queryset, cursor, id_field='id'):
+        """
+        Упорядочивает queryset по ключу (created_at, id_field) и оставляет
+        объекты после курсора в направлении курсора.
+        """
+        if cursor is None:
+            return queryset.order_by('-created_at', f'-{id_field}')
+        reverse, created_at, pk = cursor
+        if reverse:
+            return queryset.filter(
+                Q(created_at__gt=created_at)
+                | Q(created_at=created_at, **{f'{id_field}__gt': pk})
+            ).order_by('created_at', id_field)
+        return queryset.filter(
+            Q(created_at__lt=created_at)
+            | Q(created_at=created_at, **{f'{id_field}__lt': pk})
+        ).order_by('-created_at', f'-{id_field}')
+
+    def get_page(self, results, cursor, page_size):
+        """
+        Отрезает страницу из page_size + 1 объектов, выбранных
+        в направлении курсора, и запоминает курсоры соседних страниц.
+        """
+        reverse = cursor is not None and cursor[0]
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            has_next, has_previous = cursor is not None, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+
+        self.next_cursor = (
+            self.encode_cursor(results[-1], reverse=False)
+            if has_next and results else None
+        )
+        self.previous_cursor = (
+            self.encode_cursor(results[0], reverse=True)
+            if has_previous and results else None
+        )
+        return results
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.queryset = queryset
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        queryset = self.filter_by_cursor(queryset, cursor)
+        return self.get_page(list(queryset[:page_size + 1]), cursor, page_size)
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_count(self):
+        return get_feed_count(self.queryset, settings.RECIPE_FEED_COUNT_MODE)
+
+    def get_paginated_response(self, data):
+        """Возвращает ответ с пагинацией."""
+        return Response({
+            'count': self.get_count(),
+            'next': self.get_link(self.next_cursor),
+            'previous': self.get_link(self.previous_cursor),
+            'results': data
+        })
+
+
+class FeedPagination(RecipeKeysetPagination):
+    """
+    Курсорная пагинация ленты, собранной из нескольких источников
+    (см. api.timeline.get_timeline_sources). Из каждого источника
+    по индексу выбираются ключи (created_at, id рецепта) следующей
+    страницы, ключи объединяются, затем рецепты загружаются одним
+    запросом. Курсор совместим с RecipeKeysetPagination.
+    """
+
+    def paginate_sources(self, sources, recipes, request):
+        """
+        sources — пары (queryset, поле id рецепта), recipes — queryset,
+        которым загружаются рецепты страницы.
+        """
+        self.request = request
+        self.sources = sources
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        keys = set()
+        for queryset, id_field in sources:
+            keys.update(
+                self.filter_by_cursor(queryset, cursor, id_field)
+                .values_list('created_at', id_field)[:page_size + 1]
+            )
+        reverse = cursor is not None and cursor[0]
+        keys = sorted(keys, reverse=not reverse)[:page_size + 1]
+        recipes = recipes.in_bulk([pk for _, pk in keys])
+        return self.get_page(
+            [recipes[pk] for _, pk in keys if pk in recipes],
+            cursor, page_size
+        )
+
+    def get_count(self):
+        """
+        Сумма количеств по источникам. Рецепт автора, который стал
+        популярным после публикации, может быть учтен дважды.
+        """
+        return sum(
+            get_feed_count(queryset, settings.RECIPE_FEED_COUNT_MODE)
+            for queryset, _ in self.sources
+        )
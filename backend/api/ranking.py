@@ -0,0 +1,145 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from recipes.models import Favorite, Recipe, RecipeScore, ShoppingCart
+
+from .importers import IMPORT_BATCH_SIZE, iter_chunks
+from .versions import bump_model_version_on_commit
+
+# Вес добавления в избранное и в список покупок
+FAVORITE_WEIGHT = 1
+CART_WEIGHT = 2
+RANKING_EVENTS = (
+    (Favorite, FAVORITE_WEIGHT),
+    (ShoppingCart, CART_WEIGHT),
+)
+# Точка отсчета времени для trending, после нее оценка положительна
+TRENDING_EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def log2_add(first, second):
+    """log2(2^first + 2^second) без переполнения."""
+    if first < second:
+        first, second = second, first
+    return first + math.log2(1 + 2 ** (second - first))
+
+
+def get_event_score(created_at, weight):
+    """
+    Вклад события в trending в логарифмической шкале:
+    log2(weight * 2^((created_at - TRENDING_EPOCH) / период полураспада)).
+    """
+    half_lives = (
+        (created_at - TRENDING_EPOCH).total_seconds()
+        / 3600 / settings.RECIPE_TRENDING_HALF_LIFE_HOURS
+    )
+    return half_lives + math.log2(weight)
+
+
+def get_popular_score():
+    """Подзапрос popular по денормализованным счетчикам рецепта."""
+    return Subquery(
+        Recipe.objects.filter(pk=OuterRef('recipe_id')).annotate(
+            popular_score=(
+                F('favorites_count') * FAVORITE_WEIGHT
+                + F('carts_count') * CART_WEIGHT
+            )
+        ).values('popular_score')
+    )
+
+
+def collect_trending(events_filter):
+    """
+    Суммирует вклады событий, подходящих под events_filter, по рецептам.
+    Возвращает словарь {id рецепта: trending}.
+    """
+    trending = {}
+    for model, weight in RANKING_EVENTS:
+        events = model.objects.filter(events_filter).values_list(
+            'recipe_id', 'created_at'
+        ).order_by()
+        for recipe_id, created_at in events.iterator():
+            score = get_event_score(created_at, weight)
+            trending[recipe_id] = (
+                log2_add(trending[recipe_id], score)
+                if recipe_id in trending else score
+            )
+    return trending
+
+
+def update_recipe_scores(full=False, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Обновляет рейтинги рецептов для ordering=popular|trending.
+
+    popular — взвешенная сумма счетчиков избранного и списков покупок,
+    пересчитывается одним UPDATE для строк с расхождением.
+    trending — сумма весов событий, убывающих вдвое за
+    RECIPE_TRENDING_HALF_LIFE_HOURS. Она хранится как
+    log2(sum(weight * 2^((t - TRENDING_EPOCH) / период))): порядок
+    совпадает с порядком затухших сумм, поэтому затухание не требует
+    пересчета всех строк, а новые события добавляются к оценке.
+    Без full учитываются события после предыдущего запуска и все
+    события рецептов, у которых trending еще не рассчитан; удаление
+    из избранного и списка покупок уменьшает trending только
+    при полном пересчете.
+    Возвращает словарь с количеством обновленных строк.
+    """
+    stats = defaultdict(int)
+    now = timezone.now()
+    with transaction.atomic():
+        since = None
+        if full:
+            RecipeScore.objects.update(trending=0, computed_at=now)
+        else:
+            since = RecipeScore.objects.aggregate(
+                Max('computed_at')
+            )['computed_at__max']
+
+        new_ids = list(
+            Recipe.objects.filter(score__isnull=True)
+            .values_list('id', flat=True)
+        )
+        for chunk in iter_chunks(new_ids, batch_size):
+            RecipeScore.objects.bulk_create(
+                RecipeScore(recipe_id=recipe_id, computed_at=now)
+                for recipe_id in chunk
+            )
+        stats['created'] = len(new_ids)
+
+        stats['popular'] = RecipeScore.objects.exclude(
+            popular=get_popular_score()
+        ).update(popular=get_popular_score(), computed_at=now)
+
+        # У рецептов с trending=0 события еще не учитывались
+        events_filter = Q(created_at__lte=now)
+        if since is not None:
+            events_filter &= (
+                Q(created_at__gt=since) | Q(recipe__score__trending=0)
+            )
+        trending = collect_trending(events_filter)
+        for chunk in iter_chunks(trending.items(), batch_size):
+            scores = RecipeScore.objects.in_bulk(
+                [recipe_id for recipe_id, _ in chunk]
+            )
+            for recipe_id, score in chunk:
+                recipe_score = scores.get(recipe_id)
+                if recipe_score is None:
+                    # Рецепт удален во время пересчета
+                    continue
+                recipe_score.trending = (
+                    log2_add(recipe_score.trending, score)
+                    if recipe_score.trending else score
+                )
+                recipe_score.computed_at = now
+            RecipeScore.objects.bulk_update(
+                scores.values(), ['trending', 'computed_at']
+            )
+        stats['trending'] = len(trending)
+        bump_model_version_on_commit(RecipeScore)
+    return stats
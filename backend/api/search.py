@@ -0,0 +1,94 @@
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Lower
+
+from .catalogue import get_ingredient_index
+from recipes.models import Ingredient
+
+# Подстрочный поиск включается с этой длины запроса: для более коротких
+# строк триграммный индекс не помогает, и ищутся только совпадения
+# по началу названия
+MIN_CONTAINS_LENGTH = 3
+
+
+class IngredientSearch(ABC):
+    """
+    Поиск ингредиентов для автодополнения: сначала ингредиенты,
+    название которых начинается с запроса, затем — содержащие его.
+    """
+
+    @abstractmethod
+    def search(self, term):
+        """Возвращает список подходящих ингредиентов."""
+
+
+class DatabaseIngredientSearch(IngredientSearch):
+    """
+    Поиск средствами PostgreSQL по LOWER(name): совпадения по началу
+    используют btree-индекс с text_pattern_ops, подстрочные —
+    GIN-индекс pg_trgm (см. миграцию 0007).
+    """
+
+    def search(self, term):
+        term = term.lower()
+        condition = Q(name_lower__startswith=term)
+        if len(term) >= MIN_CONTAINS_LENGTH:
+            condition |= Q(name_lower__contains=term)
+        return list(
+            Ingredient.objects.annotate(name_lower=Lower('name'))
+            .filter(condition)
+            .annotate(rank=Case(
+                When(name_lower__startswith=term, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField()
+            ))
+            .order_by('rank', 'name', 'id')
+        )
+
+
+class InMemoryIngredientSearch(IngredientSearch):
+    """
+    Поиск в памяти процесса для SQLite: LOWER() в SQLite не приводит
+    к нижнему регистру кириллицу, поэтому сравнение выполняется в Python.
+    """
+
+    def search(self, term):
+        term = term.casefold()
+        prefix_matches, contains_matches = [], []
+        for ingredient in Ingredient.objects.order_by('name', 'id'):
+            name = ingredient.name.casefold()
+            if name.startswith(term):
+                prefix_matches.append(ingredient)
+            elif len(term) >= MIN_CONTAINS_LENGTH and term in name:
+                contains_matches.append(ingredient)
+        return prefix_matches + contains_matches
+
+
+class CachedIngredientSearch(IngredientSearch):
+    """
+    Поиск по индексу справочника в памяти процесса, без запросов к базе.
+    Индекс сбрасывается при изменении ингредиентов (см. api/catalogue.py).
+    """
+
+    def search(self, term):
+        index = get_ingredient_index()
+        return [
+            index.get(position)
+            for position in index.find(term, MIN_CONTAINS_LENGTH)
+        ]
+
+
+def get_ingredient_search():
+    """
+    Возвращает реализацию поиска: индекс в памяти, если он включен
+    настройкой INGREDIENT_CATALOGUE_CACHE, иначе — поиск для текущей
+    базы данных.
+    """
+    if settings.INGREDIENT_CATALOGUE_CACHE:
+        return CachedIngredientSearch()
+    if connection.vendor == 'postgresql':
+        return DatabaseIngredientSearch()
+    return InMemoryIngredientSearch()
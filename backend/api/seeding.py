@@ -0,0 +1,295 @@
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from io import BytesIO
+
+from PIL import Image
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from recipes.models import (CustomUser, Favorite, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingCart,
+                            ShoppingCartAggregate, Subscription, Tag)
+
+from .catalogue import invalidate_ingredient_index
+from .images import process_source
+from .importers import IMPORT_BATCH_SIZE, iter_chunks
+from .ranking import update_recipe_scores
+from .timeline import rebuild_timelines
+from .utils import reconcile_counters
+from .versions import bump_model_version_on_commit
+
+SEED_PASSWORD = 'seed-password'
+SEED_IMAGE = 'recipes/seed.png'
+SEED_TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+)
+SEED_INGREDIENTS_COUNT = 500
+SEED_MEASUREMENT_UNITS = ('г', 'мл', 'шт', 'ст. л.', 'ч. л.')
+# Рецепты равномерно распределяются по этому периоду
+SEED_PERIOD = timedelta(days=365)
+INGREDIENTS_PER_RECIPE = (3, 12)
+TAGS_PER_RECIPE = (1, 3)
+
+
+def zipf_weights(count, exponent=1.0):
+    """Веса закона Ципфа: элемент с рангом r получает вес 1 / r^exponent."""
+    return [1 / rank ** exponent for rank in range(1, count + 1)]
+
+
+def weighted_sample(rng, population, weights, count):
+    """
+    Выбирает count различных элементов с вероятностями,
+    пропорциональными weights.
+    """
+    count = min(count, len(population))
+    if count * 2 > len(population):
+        # Редкие элементы выпадали бы слишком долго
+        return set(rng.sample(population, count))
+    chosen = set()
+    while len(chosen) < count:
+        chosen.update(
+            rng.choices(population, weights, k=count - len(chosen))
+        )
+    return chosen
+
+
+def randomized_count(rng, mean):
+    """Случайное количество со средним mean (от 0 до 2 * mean)."""
+    return rng.randint(0, 2 * mean) if mean else 0
+
+
+class SeedStats:
+    """Количество созданных записей по моделям и время генерации."""
+
+    def __init__(self):
+        self.created = Counter()
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def __str__(self):
+        counts = ', '.join(
+            f'{model}: {count}' for model, count in self.created.items()
+        )
+        return f'{counts}; время: {self.elapsed:.2f} с'
+
+
+class SeedGenerator:
+    """
+    Генератор синтетических данных для нагрузочного тестирования.
+    Популярность авторов, рецептов и ингредиентов распределена
+    по закону Ципфа, поэтому граф подписок и избранного получается
+    степенным, как в реальных данных. Записи вставляются пачками
+    через bulk_create.
+    """
+
+    def __init__(self, seed=None, batch_size=IMPORT_BATCH_SIZE):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.stats = SeedStats()
+
+    def bulk_insert(self, model, objects):
+        """Вставляет объекты пачками и учитывает их в статистике."""
+        for chunk in iter_chunks(objects, self.batch_size):
+            model.objects.bulk_create(chunk, batch_size=self.batch_size)
+            self.stats.created[model.__name__] += len(chunk)
+
+    def popularity(self, items):
+        """Перемешивает элементы и назначает им веса по закону Ципфа."""
+        items = list(items)
+        self.rng.shuffle(items)
+        return items, zipf_weights(len(items))
+
+    def run(self, users, recipes_per_user, favorites_per_user,
+            carts_per_user, subscriptions_per_user):
+        with transaction.atomic():
+            tag_ids = self.get_tag_ids()
+            ingredient_ids = self.get_ingredient_ids()
+            user_ids = self.create_users(users)
+            recipe_ids = self.create_recipes(user_ids, recipes_per_user)
+            self.create_recipe_tags(recipe_ids, tag_ids)
+            amounts = self.create_recipe_ingredients(
+                recipe_ids, ingredient_ids
+            )
+            self.create_user_recipes(
+                Favorite, user_ids, recipe_ids, favorites_per_user
+            )
+            carts = self.create_user_recipes(
+                ShoppingCart, user_ids, recipe_ids, carts_per_user
+            )
+            self.create_shopping_cart_totals(carts, amounts)
+            self.create_subscriptions(user_ids, subscriptions_per_user)
+            # bulk_create не обновляет денормализованные счетчики
+            reconcile_counters()
+            update_recipe_scores(full=True, batch_size=self.batch_size)
+            rebuild_timelines(self.batch_size)
+            # Все рецепты используют одно изображение
+            process_source(Recipe, SEED_IMAGE)
+            # bulk_create не отправляет сигналы, сбрасывающие кеш ответов
+            bump_model_version_on_commit(Recipe)
+        return self.stats
+
+    def get_tag_ids(self):
+        if not Tag.objects.exists():
+            self.bulk_insert(
+                Tag, (Tag(name=name, slug=slug) for name, slug in SEED_TAGS)
+            )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def get_ingredient_ids(self):
+        if not Ingredient.objects.exists():
+            self.bulk_insert(Ingredient, (
+                Ingredient(
+                    name=f'ингредиент {number}',
+                    measurement_unit=self.rng.choice(SEED_MEASUREMENT_UNITS)
+                )
+                for number in range(1, SEED_INGREDIENTS_COUNT + 1)
+            ))
+            invalidate_ingredient_index()
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def create_users(self, count):
+        # На SQLite bulk_create не возвращает id, поэтому новые записи
+        # выбираются по id больше максимального до вставки
+        last_id = CustomUser.objects.aggregate(Max('id'))['id__max'] or 0
+        password = make_password(SEED_PASSWORD)
+        self.bulk_insert(CustomUser, (
+            CustomUser(
+                username=f'seed_{last_id + number}',
+                email=f'seed_{last_id + number}@example.com',
+                first_name='Seed',
+                last_name=f'User {last_id + number}',
+                password=password
+            )
+            for number in range(1, count + 1)
+        ))
+        return list(
+            CustomUser.objects.filter(id__gt=last_id)
+            .order_by('id').values_list('id', flat=True)
+        )
+
+    def create_recipes(self, user_ids, recipes_per_user):
+        if not default_storage.exists(SEED_IMAGE):
+            buffer = BytesIO()
+            Image.new('RGB', (1, 1)).save(buffer, format='PNG')
+            default_storage.save(SEED_IMAGE, ContentFile(buffer.getvalue()))
+
+        authors, weights = self.popularity(user_ids)
+        count = len(user_ids) * recipes_per_user
+        last_id = Recipe.objects.aggregate(Max('id'))['id__max'] or 0
+        self.bulk_insert(Recipe, (
+            Recipe(
+                author_id=author_id,
+                name=f'Рецепт {last_id + number}',
+                image=SEED_IMAGE,
+                text='Синтетический рецепт для нагрузочного тестирования.',
+                cooking_time=self.rng.randint(5, 180)
+            )
+            for number, author_id in enumerate(
+                self.rng.choices(authors, weights, k=count), start=1
+            )
+        ))
+
+        # created_at заполняется auto_now_add, даты разносятся отдельно
+        now = timezone.now()
+        recipes = list(
+            Recipe.objects.filter(id__gt=last_id).order_by('id').only('id')
+        )
+        for recipe in recipes:
+            recipe.created_at = now - SEED_PERIOD * self.rng.random()
+        Recipe.objects.bulk_update(
+            recipes, ['created_at'], batch_size=self.batch_size
+        )
+        return [recipe.id for recipe in recipes]
+
+    def create_recipe_tags(self, recipe_ids, tag_ids):
+        tags, weights = self.popularity(tag_ids)
+        self.bulk_insert(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in weighted_sample(
+                self.rng, tags, weights, self.rng.randint(*TAGS_PER_RECIPE)
+            )
+        ))
+
+    def create_recipe_ingredients(self, recipe_ids, ingredient_ids):
+        """Возвращает словарь {id рецепта: [(id ингредиента, количество)]}."""
+        ingredients, weights = self.popularity(ingredient_ids)
+        amounts = {
+            recipe_id: [
+                (ingredient_id, self.rng.randint(1, 500))
+                for ingredient_id in weighted_sample(
+                    self.rng, ingredients, weights,
+                    self.rng.randint(*INGREDIENTS_PER_RECIPE)
+                )
+            ]
+            for recipe_id in recipe_ids
+        }
+        self.bulk_insert(IngredientInRecipe, (
+            IngredientInRecipe(
+                recipe_id=recipe_id, ingredient_id=ingredient_id, amount=amount
+            )
+            for recipe_id, recipe_amounts in amounts.items()
+            for ingredient_id, amount in recipe_amounts
+        ))
+        return amounts
+
+    def create_user_recipes(self, model, user_ids, recipe_ids, mean):
+        """Избранное или список покупок: популярные рецепты чаще."""
+        recipes, weights = self.popularity(recipe_ids)
+        pairs = [
+            (user_id, recipe_id)
+            for user_id in user_ids
+            for recipe_id in weighted_sample(
+                self.rng, recipes, weights, randomized_count(self.rng, mean)
+            )
+        ]
+        self.bulk_insert(model, (
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id, recipe_id in pairs
+        ))
+        return pairs
+
+    def create_shopping_cart_totals(self, carts, amounts):
+        totals = defaultdict(int)
+        for user_id, recipe_id in carts:
+            for ingredient_id, amount in amounts[recipe_id]:
+                totals[user_id, ingredient_id] += amount
+        self.bulk_insert(ShoppingCartAggregate, (
+            ShoppingCartAggregate(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount
+            )
+            for (user_id, ingredient_id), amount in totals.items()
+        ))
+
+    def create_subscriptions(self, user_ids, mean):
+        # Подписываются на популярных авторов чаще — степенной граф
+        authors, weights = self.popularity(user_ids)
+        self.bulk_insert(Subscription, (
+            Subscription(follower_id=follower_id, author_id=author_id)
+            for follower_id in user_ids
+            for author_id in weighted_sample(
+                self.rng, authors, weights, randomized_count(self.rng, mean)
+            )
+            if author_id != follower_id
+        ))
+
+
+def seed_load(users, recipes_per_user=5, favorites_per_user=20,
+              carts_per_user=3, subscriptions_per_user=10, seed=None,
+              batch_size=IMPORT_BATCH_SIZE):
+    """Генерирует синтетические данные и возвращает SeedStats."""
+    return SeedGenerator(seed, batch_size).run(
+        users, recipes_per_user, favorites_per_user, carts_per_user,
+        subscriptions_per_user
+    )
@@ -1,16 +1,17 @@
-import base64
-import uuid
-from io import BytesIO
-
-from PIL import Image
 from django.contrib.auth import authenticate
-from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
 from django.db import transaction
-from drf_extra_fields.fields import Base64ImageField
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 from rest_framework.fields import ImageField
 
+from .images import (ImageUploadError, decode_base64_image, get_renditions,
+                     schedule_renditions, validate_uploaded_image)
 from .mixins import IsSubscribedMixin
+from .timeline import fan_out_recipe
+from .utils import (change_counter, get_recipe_amounts,
+                    update_shopping_cart_totals)
 from recipes.constants import MAX_VALUE, MIN_VALUE
 from recipes.models import (
     CustomUser,
@@ -24,6 +25,35 @@ from recipes.models import (
 )
 
 
+class RenditionsField(serializers.Field):
+    """
+    Ссылки на уменьшенные копии изображения (api.images):
+    {копия: {расширение: ссылка}} или None, пока копии не готовы.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs.setdefault('source', '*')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        renditions = get_renditions(instance, self.image_field)
+        if renditions is None:
+            return None
+        request = self.context.get('request')
+        return {
+            name: {
+                extension: (
+                    request.build_absolute_uri(default_storage.url(path))
+                    if request else default_storage.url(path)
+                )
+                for extension, path in formats.items()
+            }
+            for name, formats in renditions.items()
+        }
+
+
 class CustomUserSerializer(serializers.ModelSerializer, IsSubscribedMixin):
     """Сериализатор для модели CustomUser."""
     id = serializers.IntegerField(read_only=True)
@@ -33,6 +63,7 @@ class CustomUserSerializer(serializers.ModelSerializer, IsSubscribedMixin):
     last_name = serializers.CharField(read_only=True)
     is_subscribed = serializers.SerializerMethodField()
     avatar = serializers.ImageField()
+    avatar_renditions = RenditionsField('avatar')
 
     class Meta:
         model = CustomUser
@@ -43,7 +74,8 @@ class CustomUserSerializer(serializers.ModelSerializer, IsSubscribedMixin):
             'first_name',
             'last_name',
             'is_subscribed',
-            'avatar'
+            'avatar',
+            'avatar_renditions'
         )
 
 
@@ -76,6 +108,28 @@ class CustomUserCreateSerializer(serializers.ModelSerializer):
         return user
 
 
+class Base64ImageField(ImageField):
+    """
+    Изображение в формате data URI или файлом multipart/form-data.
+    Base64 декодируется блоками во временный файл, размер и число
+    пикселей проверяются до разбора изображения (api.images), а сам
+    разбор и уменьшенные копии выполняются вне запроса.
+    """
+
+    def to_internal_value(self, data):
+        try:
+            if isinstance(data, str) and data.startswith('data:image'):
+                data = decode_base64_image(data)
+            elif isinstance(data, UploadedFile):
+                data = validate_uploaded_image(data)
+            else:
+                return super().to_internal_value(data)
+        except ImageUploadError as error:
+            raise serializers.ValidationError(str(error))
+        # Проверки размера и имени FileField без повторного разбора
+        return serializers.FileField.to_internal_value(self, data)
+
+
 class AvatarSerializer(serializers.Serializer):
     """Сериализатор для аватара пользователя."""
     avatar = Base64ImageField()
@@ -159,8 +213,23 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         fields = ['id', 'amount', 'name', 'measurement_unit']
 
 
+def get_sparse_fields(request):
+    """
+    Поля, перечисленные в параметре fields (?fields=id,name,image),
+    или None, если параметр не передан.
+    """
+    fields = request.query_params.get('fields') if request else None
+    if not fields:
+        return None
+    return {field.strip() for field in fields.split(',')}
+
+
 class RecipeListSerializer(serializers.ModelSerializer):
-    """Сериализатор для модели Recipe."""
+    """
+    Сериализатор для модели Recipe.
+    Если в контексте передан набор полей fields (см. get_sparse_fields),
+    выводятся только они.
+    """
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = IngredientInRecipeSerializer(
@@ -168,13 +237,14 @@ class RecipeListSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_renditions = RenditionsField('image')
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time'
+            'name', 'image', 'image_renditions', 'text', 'cooking_time'
         )
 
     def __init__(self, *args, **kwargs):
@@ -182,17 +252,37 @@ class RecipeListSerializer(serializers.ModelSerializer):
         super().__init__(*args, **kwargs)
         request = self.context.get('request')
         self.user = request.user if request else None
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        """
+        Передает аннотацию подписки на автора во вложенный сериализатор.
+        Без поля author автор не загружается.
+        """
+        if 'author' in self.fields and hasattr(
+            instance, 'author_is_subscribed'
+        ):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
 
     def get_is_favorited(self, obj):
         """Проверяет, добавлен ли рецепт в избранное."""
-        return self._check_user_related(obj, Favorite)
+        return self._check_user_related(obj, Favorite, 'is_favorited')
 
     def get_is_in_shopping_cart(self, obj):
         """Проверяет, добавлен ли рецепт в список покупок."""
-        return self._check_user_related(obj, ShoppingCart)
+        return self._check_user_related(obj, ShoppingCart, 'is_in_cart')
 
-    def _check_user_related(self, obj, model):
-        """Проверяет, добавлен ли рецепт в избранное или список покупок."""
+    def _check_user_related(self, obj, model, annotation):
+        """
+        Проверяет, добавлен ли рецепт в избранное или список покупок.
+        Если queryset уже аннотирован флагом, запрос в базу не выполняется.
+        """
+        if hasattr(obj, annotation):
+            return getattr(obj, annotation)
         request = self.context.get('request', None)
         if not request or not hasattr(request, 'user'):
             return False
@@ -204,49 +294,22 @@ class RecipeListSerializer(serializers.ModelSerializer):
         )
 
 
-class Base64ImageField(ImageField):
-    def to_internal_value(self, data):
-        """
-        Переопределение метода to_internal_value для обработки Base64-строки.
-        """
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-
-            # Декодируем строку Base64
-            decoded_file = base64.b64decode(imgstr)
-
-            # Генерируем уникальное имя файла
-            filename = f'{uuid.uuid4()}.{ext}'
+class TagsField(serializers.ListField):
+    """
+    id тегов рецепта. Теги выбираются одним запросом, а не отдельным
+    запросом на каждый id, как в PrimaryKeyRelatedField(many=True).
+    """
+    child = serializers.IntegerField()
 
-            # Проверяем тип файла через Pillow
-            try:
-                image = Image.open(BytesIO(decoded_file))
-                file_type = image.format.lower()
-                allowed_formats = ['jpeg', 'jpg', 'png', 'gif']
-                if file_type not in allowed_formats:
-                    raise ValueError(f'Недопустимый тип файла: {file_type}')
-
-                if (
-                    file_type != ext
-                    and not (file_type == 'jpeg' and ext == 'jpg')
-                ):
-                    raise ValueError(
-                        f'Тип содержимого ({file_type}) не соответствует '
-                        f'расширению ({ext})!'
-                    )
-
-            except Exception:
-                raise ValueError('Не удалось определить тип файла!')
-
-            # Проверяем корректность типа файла
-            if file_type != ext:
-                raise ValueError('Тип файла не соответствует содержимому!')
-
-            # Возвращаем объект ContentFile
-            data = ContentFile(decoded_file, name=filename)
-
-        return super().to_internal_value(data)
+    def to_internal_value(self, data):
+        tag_ids = super().to_internal_value(data)
+        tags = Tag.objects.in_bulk(tag_ids)
+        for tag_id in tag_ids:
+            if tag_id not in tags:
+                raise serializers.ValidationError(
+                    f'Тег с ID {tag_id} не существует.'
+                )
+        return [tags[tag_id] for tag_id in tag_ids]
 
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
@@ -259,10 +322,7 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         many=True,
         source='ingredient_in_recipe'
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
-    )
+    tags = TagsField()
     image = Base64ImageField()
     cooking_time = serializers.IntegerField(
         max_value=MAX_VALUE, min_value=MIN_VALUE
@@ -340,16 +400,40 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Изображение обязательно.')
         return value
 
-    def _save_ingredients(self, recipe, ingredients):
-        """Сохраняет ингредиенты для рецепта."""
-        IngredientInRecipe.objects.filter(recipe=recipe).delete()
-        IngredientInRecipe.objects.bulk_create([
+    def _save_ingredients(self, recipe, ingredients, created=False):
+        """
+        Сохраняет ингредиенты для рецепта и переносит разницу в суммы
+        списков покупок пользователей, добавивших рецепт.
+        Новый рецепт еще не добавлен в списки покупок, поэтому для него
+        старые ингредиенты и суммы не запрашиваются.
+        """
+        recipe_ingredients = [
             IngredientInRecipe(
                 recipe=recipe,
                 ingredient_id=ingredient['id'],
                 amount=ingredient['amount']
             ) for ingredient in ingredients
-        ])
+        ]
+        if created:
+            IngredientInRecipe.objects.bulk_create(recipe_ingredients)
+            return recipe
+
+        deltas = {
+            ingredient_id: -amount
+            for ingredient_id, amount in get_recipe_amounts(recipe).items()
+        }
+        IngredientInRecipe.objects.filter(recipe=recipe).delete()
+        IngredientInRecipe.objects.bulk_create(recipe_ingredients)
+        for ingredient in ingredients:
+            deltas[ingredient['id']] = (
+                deltas.get(ingredient['id'], 0) + ingredient['amount']
+            )
+        update_shopping_cart_totals(
+            ShoppingCart.objects.filter(recipe=recipe).values_list(
+                'user_id', flat=True
+            ),
+            deltas
+        )
         return recipe
 
     @transaction.atomic
@@ -359,15 +443,18 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags', [])
         ingredients = validated_data.pop('ingredient_in_recipe', [])
         recipe = Recipe.objects.create(**validated_data)
+        change_counter(CustomUser, recipe.author_id, 'recipes_count', 1)
         recipe.tags.set(tags)
-        self._save_ingredients(recipe, ingredients)
+        self._save_ingredients(recipe, ingredients, created=True)
+        fan_out_recipe(recipe)
+        schedule_renditions(recipe)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
         """Обновляет рецепт."""
         tags = validated_data.pop('tags', None)
-        ingredients = validated_data.pop('ingredients', None)
+        ingredients = validated_data.pop('ingredient_in_recipe', None)
         if tags:
             instance.tags.set(tags)
         else:
@@ -381,18 +468,39 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Поле ингредиентов не может быть пустым.'
             )
-        return super().update(instance, validated_data)
+        previous_image = instance.image.name
+        recipe = super().update(instance, validated_data)
+        # Фронтенд отправляет изображение при каждом изменении рецепта,
+        # те же байты сохраняются под прежним именем
+        if recipe.image.name != previous_image:
+            schedule_renditions(recipe)
+        return recipe
 
     def to_representation(self, instance):
-        """Переопределяет представление рецепта."""
+        """
+        Переопределяет представление рецепта. Теги и ингредиенты
+        подгружаются пачкой, а не отдельным запросом на каждый ингредиент.
+        """
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch(
+                'ingredient_in_recipe',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
         return RecipeListSerializer(instance, context=self.context).data
 
 
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
     """Сериализатор для минимизированного представления рецептов."""
+    image_renditions = RenditionsField('image')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
 
 
 class SubscriptionSerializer(serializers.ModelSerializer, IsSubscribedMixin):
@@ -407,8 +515,11 @@ class SubscriptionSerializer(serializers.ModelSerializer, IsSubscribedMixin):
         source='author.last_name', read_only=True
     )
     avatar = serializers.ImageField(source='author.avatar', read_only=True)
+    avatar_renditions = RenditionsField('avatar', source='author')
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(
+        source='author.recipes_count', read_only=True
+    )
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -419,6 +530,7 @@ class SubscriptionSerializer(serializers.ModelSerializer, IsSubscribedMixin):
                   'first_name',
                   'last_name',
                   'avatar',
+                  'avatar_renditions',
                   'is_subscribed',
                   'recipes',
                   'recipes_count'
@@ -426,12 +538,11 @@ class SubscriptionSerializer(serializers.ModelSerializer, IsSubscribedMixin):
 
     def get_recipes(self, obj):
         """Получение списка рецептов автора."""
-        recipes_limit = self.context.get('recipes_limit', None)
-        queryset = Recipe.objects.filter(author=obj.author)
-        if recipes_limit:
-            queryset = queryset[:recipes_limit]
+        if hasattr(obj, 'recent_recipes'):
+            queryset = obj.recent_recipes
+        else:
+            recipes_limit = self.context.get('recipes_limit', None)
+            queryset = Recipe.objects.filter(author=obj.author)
+            if recipes_limit:
+                queryset = queryset[:recipes_limit]
         return RecipeMinifiedSerializer(queryset, many=True).data
-
-    def get_recipes_count(self, obj):
-        """Получение количества рецептов автора."""
-        return obj.author.recipes.count()
@@ -0,0 +1,158 @@
+import atexit
+import logging
+import string
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from recipes.models import Recipe, ShortLinkHits
+
+logger = logging.getLogger(__name__)
+
+BASE62_ALPHABET = string.digits + string.ascii_letters
+BASE62_INDEX = {char: index for index, char in enumerate(BASE62_ALPHABET)}
+# 11 символов base62 вмещают любой id BigAutoField
+SHORT_LINK_MAX_LENGTH = 11
+MAX_RECIPE_ID = 2 ** 63 - 1
+SHORT_LINK_CACHE_PREFIX = 'short_link'
+
+
+def encode_base62(number):
+    """Запись неотрицательного числа в base62 без ведущих нулей."""
+    if number == 0:
+        return BASE62_ALPHABET[0]
+    chars = []
+    while number:
+        number, remainder = divmod(number, len(BASE62_ALPHABET))
+        chars.append(BASE62_ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+def decode_base62(code):
+    """
+    Число, записанное в base62. Коды с недопустимыми символами,
+    ведущими нулями (у каждого числа один код) и больше MAX_RECIPE_ID
+    вызывают ValueError.
+    """
+    if not code or len(code) > SHORT_LINK_MAX_LENGTH or (
+        len(code) > 1 and code[0] == BASE62_ALPHABET[0]
+    ):
+        raise ValueError(f'Некорректный код: {code}')
+    number = 0
+    for char in code:
+        try:
+            number = number * len(BASE62_ALPHABET) + BASE62_INDEX[char]
+        except KeyError:
+            raise ValueError(f'Некорректный код: {code}')
+    if number > MAX_RECIPE_ID:
+        raise ValueError(f'Некорректный код: {code}')
+    return number
+
+
+def get_short_link_code(recipe_id):
+    """
+    Код короткой ссылки — id рецепта в base62: коды не пересекаются
+    и не хранятся в базе.
+    """
+    return encode_base62(recipe_id)
+
+
+def _cache_key(recipe_id):
+    return f'{SHORT_LINK_CACHE_PREFIX}:{recipe_id}'
+
+
+def resolve_short_link(code):
+    """
+    id рецепта по коду короткой ссылки или None. Существование рецепта
+    берется из кеша, а при промахе — одним запросом по первичному ключу.
+    """
+    try:
+        recipe_id = decode_base62(code)
+    except ValueError:
+        return None
+    key = _cache_key(recipe_id)
+    exists = cache.get(key)
+    if exists is None:
+        exists = Recipe.objects.filter(pk=recipe_id).exists()
+        cache.set(key, exists, settings.SHORT_LINK_CACHE_TIMEOUT)
+    return recipe_id if exists else None
+
+
+def invalidate_short_link_on_commit(recipe_id):
+    """Сбрасывает закешированное существование рецепта."""
+    transaction.on_commit(lambda: cache.delete(_cache_key(recipe_id)))
+
+
+def save_hits(hits):
+    """
+    Прибавляет переходы {id рецепта: количество} к счетчикам:
+    запрос существующих рецептов, вставка недостающих строк и по одному
+    UPDATE на каждое различное количество переходов.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        recipe_ids = list(
+            Recipe.objects.filter(pk__in=hits).values_list('pk', flat=True)
+        )
+        ShortLinkHits.objects.bulk_create(
+            (ShortLinkHits(recipe_id=recipe_id) for recipe_id in recipe_ids),
+            ignore_conflicts=True
+        )
+        by_count = defaultdict(list)
+        for recipe_id in recipe_ids:
+            by_count[hits[recipe_id]].append(recipe_id)
+        for count, ids in by_count.items():
+            ShortLinkHits.objects.filter(recipe_id__in=ids).update(
+                hits=F('hits') + count, last_hit_at=now
+            )
+
+
+class ShortLinkHitBuffer:
+    """
+    Переходы по коротким ссылкам, накопленные в процессе. Записываются
+    в базу, когда накопится SHORT_LINK_FLUSH_HITS переходов или пройдет
+    SHORT_LINK_FLUSH_INTERVAL секунд, а также при завершении процесса.
+    Переходы, не записанные до аварийного завершения, теряются.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = Counter()
+        self.pending = 0
+        self.flushed_at = time.monotonic()
+
+    def add(self, recipe_id):
+        with self.lock:
+            self.hits[recipe_id] += 1
+            self.pending += 1
+            if (
+                self.pending < settings.SHORT_LINK_FLUSH_HITS
+                and time.monotonic() - self.flushed_at
+                < settings.SHORT_LINK_FLUSH_INTERVAL
+            ):
+                return
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            hits, self.hits = self.hits, Counter()
+            self.pending = 0
+            self.flushed_at = time.monotonic()
+        if not hits:
+            return
+        try:
+            save_hits(hits)
+        except Exception:
+            logger.exception(
+                'Не удалось записать переходы по коротким ссылкам'
+            )
+
+
+hit_buffer = ShortLinkHitBuffer()
+atexit.register(hit_buffer.flush)
@@ -0,0 +1,92 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import (invalidate_token_on_commit,
+                             invalidate_user_tokens_on_commit)
+from .shortlinks import invalidate_short_link_on_commit
+from .versions import (bump_model_version_on_commit,
+                       bump_object_versions_on_commit)
+from recipes.models import (CustomUser, Ingredient, IngredientInRecipe,
+                            Recipe, Tag)
+
+# Поля автора, которые выводятся в рецептах (CustomUserSerializer)
+AUTHOR_FIELDS = frozenset((
+    'username', 'email', 'first_name', 'last_name',
+    'avatar', 'avatar_renditions',
+))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def catalogue_changed(sender, **kwargs):
+    """
+    Меняет версию справочника после фиксации транзакции: сбрасывает
+    индекс ингредиентов и ETag ответов API. Иначе параллельный запрос
+    увидел бы новую версию раньше новых строк и сохранил бы под ней
+    старые данные.
+    """
+    bump_model_version_on_commit(sender)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def recipes_changed(sender, instance, **kwargs):
+    """
+    Сбрасывает кеш ответов со списком и карточками рецептов
+    и фрагменты измененного рецепта (api.fragments).
+    Теги меняются вместе с сохранением рецепта, поэтому m2m_changed
+    не отслеживается: обработчик отключил бы быстрое добавление тегов.
+    """
+    bump_model_version_on_commit(Recipe)
+    bump_object_versions_on_commit(
+        Recipe, [instance.pk if sender is Recipe else instance.recipe_id]
+    )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def short_link_target_changed(sender, instance, created=True, **kwargs):
+    """
+    Существование рецепта для коротких ссылок кешируется, в том числе
+    отрицательный результат для еще не созданного id.
+    """
+    if created:
+        invalidate_short_link_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=CustomUser)
+def author_changed(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Данные автора выводятся в рецептах. Новый пользователь еще
+    не автор, а пароль, вход (last_login) и другие поля, которых нет
+    в ответах (AUTHOR_FIELDS), кеш рецептов не сбрасывают.
+    """
+    if created or (
+        update_fields is not None and not AUTHOR_FIELDS & update_fields
+    ):
+        return
+    bump_model_version_on_commit(Recipe)
+    bump_object_versions_on_commit(CustomUser, [instance.pk])
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Выход (AuthTokenViewSet.logout) и удаление токена в админке."""
+    invalidate_token_on_commit(instance.key, instance.user_id)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def token_user_changed(sender, instance, created=False, **kwargs):
+    """
+    Поля пользователя закешированы вместе с токеном: после отключения
+    учетной записи или снятия прав администратора токен не должен
+    давать прежний доступ.
+    """
+    if not created:
+        invalidate_user_tokens_on_commit(instance.pk)
@@ -0,0 +1,83 @@
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.authentication import local_tokens
+from recipes.models import (CustomUser, Ingredient, IngredientInRecipe,
+                            Recipe, Tag)
+
+RECIPES_URL = '/api/recipes/?limit=100'
+
+
+def create_user(username, **kwargs):
+    """Пользователь с email username@example.com."""
+    return CustomUser.objects.create_user(
+        email=f'{username}@example.com',
+        username=username,
+        first_name=username,
+        last_name=username,
+        password='test-password',
+        **kwargs
+    )
+
+
+def create_recipes(author, count, tags, ingredients):
+    """count рецептов автора со всеми тегами и ингредиентами."""
+    recipes = []
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=f'Рецепт {author.username} {number}',
+            image='recipes/test.png',
+            text='Описание',
+            cooking_time=10
+        )
+        recipe.tags.set(tags)
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=5)
+            for ingredient in ingredients
+        )
+        recipes.append(recipe)
+    return recipes
+
+
+class APITestCase(TestCase):
+    """
+    Общие данные тестов API: пользователь, автор, два тега и два
+    ингредиента. Кеши очищаются перед каждым тестом, клиент
+    авторизован пользователем user.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        cls.author = create_user('author')
+        cls.tags = [
+            Tag.objects.create(name='Завтрак', slug='breakfast'),
+            Tag.objects.create(name='Обед', slug='lunch'),
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name='Соль', measurement_unit='г'),
+            Ingredient.objects.create(name='Мука', measurement_unit='г'),
+        ]
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, client, url):
+        """Число SQL-запросов ответа на GET url с пустыми кешами."""
+        clear_caches()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+    local_tokens.clear()
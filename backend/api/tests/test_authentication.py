@@ -0,0 +1,112 @@
+import shutil
+import tempfile
+import time
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import (TOKEN_USER_FIELDS, CachedTokenAuthentication,
+                                cache_token, get_cached_user, mark_invalidated)
+from api.images import process_source
+from api.versions import get_model_version
+from recipes.models import CustomUser, Recipe
+
+from .base import APITestCase
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+    """Сброс кеша токенов при изменении пользователя."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def authenticate(self):
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_renditions_invalidate_cached_user(self):
+        buffer = BytesIO()
+        Image.new('RGB', (4, 4)).save(buffer, format='PNG')
+        source = default_storage.save(
+            'avatars/test.png', ContentFile(buffer.getvalue())
+        )
+        CustomUser.objects.filter(pk=self.user.pk).update(avatar=source)
+        self.authenticate()
+        self.assertIsNotNone(get_cached_user(self.token.key))
+        recipe_version = get_model_version(Recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            process_source(CustomUser, source)
+        self.assertIsNone(get_cached_user(self.token.key))
+        # Копии аватара не сбрасывают кеш ответов со списком рецептов
+        self.assertEqual(get_model_version(Recipe), recipe_version)
+
+    def test_caches_only_auth_fields(self):
+        self.authenticate()
+        self.assertEqual(
+            set(get_cached_user(self.token.key)), set(TOKEN_USER_FIELDS)
+        )
+        with self.assertNumQueries(0):
+            user, _ = CachedTokenAuthentication().authenticate_credentials(
+                self.token.key
+            )
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertIn('password', user.get_deferred_fields())
+
+    def test_profile_changes_keep_counters(self):
+        self.authenticate()
+        renditions = {'source': 'avatars/test.png', 'paths': {}}
+        CustomUser.objects.filter(pk=self.user.pk).update(
+            followers_count=5, recipes_count=3, avatar_renditions=renditions
+        )
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'test-password',
+            'new_password': 'new-test-password',
+        })
+        self.assertEqual(response.status_code, 204, response.content)
+        response = self.client.delete('/api/users/me/avatar/')
+        self.assertEqual(response.status_code, 204)
+        user = CustomUser.objects.get(pk=self.user.pk)
+        self.assertTrue(user.check_password('new-test-password'))
+        self.assertEqual(
+            (user.followers_count, user.recipes_count, user.avatar_renditions),
+            (5, 3, renditions)
+        )
+
+    def test_deactivated_user_rejected(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+            CustomUser.objects.get(pk=self.user.pk).save()
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_invalidation_during_read_not_cached(self):
+        started_at = time.time_ns()
+        data = dict.fromkeys(TOKEN_USER_FIELDS, True)
+        data['id'] = self.user.pk
+        # Сброс зафиксирован после чтения токена из базы
+        mark_invalidated(self.user.pk)
+        cache_token(self.token.key, data, started_at)
+        self.assertIsNone(get_cached_user(self.token.key))
@@ -0,0 +1,67 @@
+from django.test import TestCase
+
+from api.utils import change_counter
+from recipes.models import CustomUser, Recipe, Subscription
+
+from .base import APITestCase, create_recipes, create_user
+
+
+class CounterFieldsTest(TestCase):
+    """Сохранение объекта не перезаписывает счетчики, измененные F()."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.recipe = create_recipes(cls.author, 1, [], [])[0]
+
+    def test_recipe_save_keeps_counters(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        change_counter(Recipe, recipe.pk, 'favorites_count', 2)
+        change_counter(Recipe, recipe.pk, 'carts_count', 1)
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favorites_count, 2)
+        self.assertEqual(recipe.carts_count, 1)
+
+    def test_user_save_keeps_counters(self):
+        user = CustomUser.objects.get(pk=self.author.pk)
+        change_counter(CustomUser, user.pk, 'followers_count', 3)
+        user.first_name = 'Иван'
+        user.save()
+        user.refresh_from_db()
+        self.assertEqual(user.first_name, 'Иван')
+        self.assertEqual(user.followers_count, 3)
+        self.assertEqual(user.recipes_count, 0)
+
+    def test_deferred_fields_not_loaded(self):
+        recipe = Recipe.objects.only('id', 'name').get(pk=self.recipe.pk)
+        recipe.name = 'Другое название'
+        with self.assertNumQueries(1):
+            recipe.save()
+
+
+class FollowersCountTest(APITestCase):
+    """Счетчик подписчиков меняется, только если подписка изменилась."""
+
+    def get_followers_count(self):
+        return CustomUser.objects.get(pk=self.author.pk).followers_count
+
+    def test_repeated_requests(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        for method, status, count in (
+            ('post', 201, 1), ('post', 400, 1),
+            ('delete', 204, 0), ('delete', 400, 0),
+        ):
+            with self.subTest(method=method, status=status):
+                response = getattr(self.client, method)(url)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(self.get_followers_count(), count)
+
+    def test_subscription_added_by_concurrent_request(self):
+        # Подписку успела создать параллельная транзакция
+        Subscription.objects.create(follower=self.user, author=self.author)
+        response = self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_followers_count(), 0)
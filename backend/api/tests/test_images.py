@@ -0,0 +1,38 @@
+import base64
+import os
+from io import BytesIO
+
+from django.test import SimpleTestCase
+from PIL import Image
+
+from api.images import ImageUploadError, decode_base64_image
+
+
+def get_png_base64(side=8):
+    """PNG из случайных пикселей: не сжимается, занимает несколько блоков."""
+    buffer = BytesIO()
+    Image.frombytes(
+        'RGB', (side, side), os.urandom(side * side * 3)
+    ).save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+class DecodeBase64ImageTest(SimpleTestCase):
+    """Декодирование изображений в формате data URI."""
+
+    def test_line_breaks_allowed(self):
+        encoded = get_png_base64(side=200)
+        # Строки по 76 символов, как в MIME
+        wrapped = '\r\n'.join(
+            encoded[start:start + 76] for start in range(0, len(encoded), 76)
+        )
+        for payload in (encoded, wrapped, f' {encoded}\n'):
+            with self.subTest(payload=payload[:20]):
+                file = decode_base64_image(f'data:image/png;base64,{payload}')
+                self.assertEqual(file.read(), base64.b64decode(encoded))
+
+    def test_invalid_characters_rejected(self):
+        with self.assertRaises(ImageUploadError):
+            decode_base64_image(
+                f'data:image/png;base64,{get_png_base64()[:-4]}!!!!'
+            )
@@ -0,0 +1,43 @@
+import tempfile
+from pathlib import Path
+
+from django.test import TestCase
+
+from api.importers import import_users
+from recipes.models import CustomUser
+
+from .base import create_user
+
+
+class ImportUsersTest(TestCase):
+    """Загрузка пользователей командой import_users."""
+
+    def import_csv(self, rows):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, 'users.csv')
+            path.write_text(
+                '\n'.join(','.join(row) for row in rows), encoding='utf-8'
+            )
+            return import_users(path, workers=1)
+
+    def test_normalizes_email_and_username(self):
+        stats = self.import_csv([
+            ('Анна', 'Иванова', 'anna', 'Anna@EXAMPLE.COM', 'password'),
+            # Знак кельвина приводится NFKC к латинской K
+            ('Kelvin', 'K', '\u212aelvin', 'kelvin@example.com', 'password'),
+        ])
+        self.assertEqual(stats.created, 2)
+        self.assertTrue(
+            CustomUser.objects.filter(email='Anna@example.com').exists()
+        )
+        self.assertTrue(CustomUser.objects.filter(username='Kelvin').exists())
+        user = CustomUser.objects.get(username='anna')
+        self.assertTrue(user.check_password('password'))
+
+    def test_skips_existing_users_after_normalization(self):
+        create_user('anna')
+        stats = self.import_csv([
+            ('Анна', 'Иванова', 'other', 'anna@EXAMPLE.com', 'password'),
+        ])
+        self.assertEqual(stats.rows, 1)
+        self.assertEqual(stats.created, 0)
@@ -0,0 +1,231 @@
+import base64
+import shutil
+import tempfile
+from collections import namedtuple
+from io import BytesIO
+
+from django.db import transaction
+from django.test import override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import CachedTokenAuthentication
+from api.management.profiling import query_budget, read_response
+from api.pagination import RecipeKeysetPagination
+from api.ranking import update_recipe_scores
+from api.shortlinks import get_short_link_code
+from recipes.models import Recipe
+
+from .base import APITestCase, clear_caches, create_recipes, create_user
+
+QueryBudget = namedtuple(
+    'QueryBudget',
+    ('method', 'url', 'queries', 'data', 'setup', 'token_queries'),
+    defaults=(None, None, None)
+)
+
+BUDGET_PASSWORD = 'test-password'
+
+# Число SQL-запросов действий API, включая SAVEPOINT транзакций,
+# на данных QueryBudgetTest с пустыми кешами.
+# В адресах подставляются:
+# recipe — чужой рецепт, own_recipe — рецепт пользователя,
+# author — автор, на которого пользователь не подписан, tag — slug тега,
+# ingredient — id ингредиента, name — начало его названия,
+# feed_cursor — курсор страницы после самого нового рецепта,
+# short_code — код короткой ссылки на recipe.
+# token_queries — число запросов при аутентификации по токену из кеша,
+# если оно отличается от queries.
+QUERY_BUDGETS = (
+    QueryBudget('get', '/api/recipes/', 6),
+    QueryBudget('get', '/api/recipes/?limit=100', 6),
+    QueryBudget('get', '/api/recipes/?pagination=cursor', 6),
+    QueryBudget(
+        'get', '/api/recipes/?tags={tag}&is_favorited=1'
+        '&is_in_shopping_cart=1', 6
+    ),
+    QueryBudget('get', '/api/recipes/?ordering=popular', 6),
+    QueryBudget('get', '/api/recipes/?ordering=trending', 6),
+    QueryBudget('get', '/api/recipes/feed/', 9),
+    QueryBudget('get', '/api/recipes/feed/?cursor={feed_cursor}', 9),
+    QueryBudget('get', '/api/recipes/{recipe}/', 3),
+    QueryBudget('post', '/api/recipes/', 14, 'recipe'),
+    QueryBudget('patch', '/api/recipes/{own_recipe}/', 17, 'recipe'),
+    QueryBudget('delete', '/api/recipes/{own_recipe}/', 16),
+    QueryBudget('post', '/api/recipes/{recipe}/favorite/', 8),
+    QueryBudget('delete', '/api/recipes/{recipe}/favorite/', 5, setup='post'),
+    QueryBudget('post', '/api/recipes/{recipe}/shopping_cart/', 14),
+    QueryBudget(
+        'delete', '/api/recipes/{recipe}/shopping_cart/', 11, setup='post'
+    ),
+    QueryBudget('get', '/api/recipes/download_shopping_cart/', 1),
+    QueryBudget('get', '/api/recipes/download_shopping_cart/?format=csv', 1),
+    QueryBudget('get', '/api/recipes/{recipe}/get-link/', 1),
+    QueryBudget('get', '/s/{short_code}', 1),
+    QueryBudget('get', '/api/users/', 2),
+    QueryBudget('get', '/api/users/{author}/', 1),
+    QueryBudget('post', '/api/users/', 3, 'user'),
+    QueryBudget('get', '/api/users/me/', 0),
+    # Хеш пароля не хранится в кеше токенов
+    QueryBudget(
+        'post', '/api/users/set_password/', 1, 'password', token_queries=2
+    ),
+    QueryBudget('get', '/api/users/subscriptions/?recipes_limit=3', 3),
+    QueryBudget(
+        'post', '/api/users/{author}/subscribe/?recipes_limit=3', 11
+    ),
+    QueryBudget(
+        'delete', '/api/users/{author}/subscribe/', 7, setup='post'
+    ),
+    QueryBudget('put', '/api/users/me/avatar/', 1, 'avatar'),
+    QueryBudget('delete', '/api/users/me/avatar/', 1),
+    QueryBudget('get', '/api/tags/', 1),
+    QueryBudget('get', '/api/tags/{tag_id}/', 1),
+    QueryBudget('get', '/api/ingredients/', 1),
+    QueryBudget('get', '/api/ingredients/?name={name}', 1),
+    QueryBudget('get', '/api/ingredients/{ingredient}/', 1),
+)
+
+
+def get_image_data():
+    """Изображение 1x1 в формате data URI для запросов с загрузкой."""
+    buffer = BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, format='PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+@override_settings(
+    # Переходы по коротким ссылкам записываются пачкой не при каждом
+    # запросе, поэтому в проверке не записываются вовсе
+    SHORT_LINK_FLUSH_HITS=float('inf'),
+    SHORT_LINK_FLUSH_INTERVAL=float('inf')
+)
+class QueryBudgetTest(APITestCase):
+    """
+    Число SQL-запросов основных действий API и отсутствие повторов
+    одинаковых запросов (N+1). Каждый запрос выполняется в точке
+    сохранения, которая откатывается.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe = create_recipes(
+            cls.author, 3, cls.tags, cls.ingredients
+        )[0]
+        cls.own_recipe = create_recipes(
+            cls.user, 2, cls.tags, cls.ingredients
+        )[0]
+        followed = create_user('followed')
+        followed_recipes = create_recipes(
+            followed, 2, cls.tags, cls.ingredients
+        )
+        client = APIClient()
+        client.force_authenticate(cls.user)
+        client.post(f'/api/users/{followed.id}/subscribe/')
+        for recipe in followed_recipes:
+            client.post(f'/api/recipes/{recipe.id}/favorite/')
+            client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        update_recipe_scores(full=True)
+        cls.token = Token.objects.create(user=cls.user)
+        image = get_image_data()
+        cls.values = {
+            'recipe': cls.recipe.id,
+            'own_recipe': cls.own_recipe.id,
+            'author': cls.author.id,
+            'tag': cls.tags[0].slug,
+            'tag_id': cls.tags[0].id,
+            'ingredient': cls.ingredients[0].id,
+            'name': cls.ingredients[0].name[:2],
+            'short_code': get_short_link_code(cls.recipe.id),
+            'feed_cursor': RecipeKeysetPagination().encode_cursor(
+                Recipe.objects.order_by('-created_at', '-id').first(),
+                reverse=False
+            ),
+        }
+        cls.payloads = {
+            'recipe': {
+                'name': 'Проверка бюджета',
+                'text': 'Рецепт для проверки бюджета запросов.',
+                'cooking_time': 10,
+                'image': image,
+                'tags': [tag.id for tag in cls.tags],
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': 10}
+                    for ingredient in cls.ingredients
+                ],
+            },
+            'user': {
+                'email': 'budget@example.com',
+                'username': 'budget',
+                'first_name': 'Budget',
+                'last_name': 'Check',
+                'password': BUDGET_PASSWORD,
+            },
+            'password': {
+                'current_password': BUDGET_PASSWORD,
+                'new_password': f'{BUDGET_PASSWORD}-new',
+            },
+            'avatar': {'avatar': image},
+        }
+
+    def test_query_budgets(self):
+        for budget in QUERY_BUDGETS:
+            url = budget.url.format(**self.values)
+            with self.subTest(method=budget.method, url=url):
+                self.check_budget(self.client, budget, url, budget.queries)
+
+    def test_query_budgets_with_token(self):
+        """
+        Аутентификация по токену из кеша (CachedTokenAuthentication)
+        не добавляет запросов: поля request.user, которые выводятся
+        в ответах, загружены.
+        """
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        for budget in QUERY_BUDGETS:
+            url = budget.url.format(**self.values)
+            with self.subTest(method=budget.method, url=url):
+                self.check_budget(
+                    client, budget, url,
+                    budget.token_queries or budget.queries,
+                    warm_up=lambda: CachedTokenAuthentication()
+                    .authenticate_credentials(self.token.key)
+                )
+
+    def check_budget(self, client, budget, url, queries, warm_up=None):
+        request = getattr(client, budget.method)
+        data = self.payloads.get(budget.data)
+        with transaction.atomic():
+            if budget.setup:
+                getattr(client, budget.setup)(url)
+            clear_caches()
+            if warm_up:
+                warm_up()
+            with self.assertNumQueries(queries), query_budget(
+                max_repeats=1
+            ):
+                response = (
+                    request(url) if data is None
+                    else request(url, data, format='json')
+                )
+                content = read_response(response)
+            self.assertLess(response.status_code, 400, content)
+            transaction.set_rollback(True)
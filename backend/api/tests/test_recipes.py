@@ -0,0 +1,229 @@
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.ranking import update_recipe_scores
+from recipes.models import (Favorite, Recipe, RecipeScore, ShoppingCart,
+                            ShoppingCartAggregate, Subscription)
+
+from .base import RECIPES_URL, APITestCase, create_recipes, create_user
+
+
+class RecipeListQueryCountTest(APITestCase):
+    """Число запросов списков не зависит от числа рецептов (N+1)."""
+
+    def assert_constant_queries(self, client, url, add_objects):
+        """Сравнивает число запросов для N и 2N объектов."""
+        add_objects()
+        queries = self.count_queries(client, url)
+        add_objects()
+        self.assertEqual(self.count_queries(client, url), queries)
+
+    def add_recipes(self):
+        create_recipes(self.author, 3, self.tags, self.ingredients)
+
+    def test_anonymous_list(self):
+        with override_settings(RECIPE_RESPONSE_CACHE=False):
+            self.assert_constant_queries(
+                APIClient(), RECIPES_URL, self.add_recipes
+            )
+
+    def test_authenticated_list(self):
+        for fragments in (False, True):
+            with self.subTest(fragments=fragments), override_settings(
+                RECIPE_FRAGMENT_CACHE=fragments
+            ):
+                self.assert_constant_queries(
+                    self.client, RECIPES_URL, self.add_recipes
+                )
+
+    def test_sparse_fields_without_author(self):
+        url = f'{RECIPES_URL}&fields=id,name'
+        with override_settings(RECIPE_FRAGMENT_CACHE=False):
+            self.assert_constant_queries(self.client, url, self.add_recipes)
+            self.assertLessEqual(
+                self.count_queries(self.client, url),
+                self.count_queries(self.client, RECIPES_URL)
+            )
+
+    def test_authenticated_list_with_flags(self):
+        def add_recipes():
+            for recipe in create_recipes(
+                self.author, 3, self.tags, self.ingredients
+            ):
+                Favorite.objects.create(user=self.user, recipe=recipe)
+                ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+        Subscription.objects.create(follower=self.user, author=self.author)
+        with override_settings(RECIPE_FRAGMENT_CACHE=False):
+            self.assert_constant_queries(
+                self.client,
+                f'{RECIPES_URL}&is_favorited=1&is_in_shopping_cart=1'
+                f'&tags={self.tags[0].slug}',
+                add_recipes
+            )
+
+    def test_subscriptions(self):
+        authors = iter(range(100))
+
+        def add_subscriptions():
+            for _ in range(3):
+                author = create_user(f'author{next(authors)}')
+                create_recipes(author, 2, self.tags, self.ingredients)
+                Subscription.objects.create(follower=self.user, author=author)
+
+        self.assert_constant_queries(
+            self.client,
+            '/api/users/subscriptions/?limit=100&recipes_limit=1',
+            add_subscriptions
+        )
+
+
+class RecipeFilterTest(APITestCase):
+    """Фильтры списка рецептов (подзапросы EXISTS)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        breakfast, lunch = cls.tags
+        cls.both, cls.breakfast, cls.lunch = (
+            create_recipes(cls.author, 1, tags, cls.ingredients)[0]
+            for tags in ((breakfast, lunch), (breakfast,), (lunch,))
+        )
+        Favorite.objects.create(user=cls.user, recipe=cls.breakfast)
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.lunch)
+        # Списки другого пользователя не влияют на результат
+        other = create_user('other')
+        Favorite.objects.create(user=other, recipe=cls.lunch)
+        ShoppingCart.objects.create(user=other, recipe=cls.both)
+
+    def get_ids(self, query, client=None):
+        response = (client or self.client).get(f'{RECIPES_URL}&{query}')
+        self.assertEqual(response.status_code, 200)
+        ids = [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(len(ids), response.data['count'])
+        return set(ids)
+
+    def test_is_favorited(self):
+        self.assertEqual(self.get_ids('is_favorited=1'), {self.breakfast.id})
+
+    def test_is_in_shopping_cart(self):
+        self.assertEqual(
+            self.get_ids('is_in_shopping_cart=1'), {self.lunch.id}
+        )
+
+    def test_user_lists_ignored_for_anonymous(self):
+        self.assertEqual(
+            self.get_ids('is_favorited=1', APIClient()),
+            {self.both.id, self.breakfast.id, self.lunch.id}
+        )
+
+    def test_tags(self):
+        self.assertEqual(
+            self.get_ids('tags=breakfast'), {self.both.id, self.breakfast.id}
+        )
+        # Рецепт с обоими тегами не дублируется
+        self.assertEqual(
+            self.get_ids('tags=breakfast&tags=lunch'),
+            {self.both.id, self.breakfast.id, self.lunch.id}
+        )
+        self.assertEqual(self.get_ids('tags=unknown'), set())
+
+    def test_filters_compile_to_exists(self):
+        """
+        Фильтры не соединяют рецепты с тегами, избранным и списком
+        покупок: строки не размножаются, DISTINCT не нужен.
+        """
+        for query, table in (
+            ('tags=breakfast&tags=lunch', Recipe.tags.through._meta.db_table),
+            ('is_favorited=1', Favorite._meta.db_table),
+            ('is_in_shopping_cart=1', ShoppingCart._meta.db_table),
+        ):
+            with self.subTest(query=query), override_settings(
+                RECIPE_FRAGMENT_CACHE=False
+            ), CaptureQueriesContext(connection) as queries:
+                self.get_ids(query)
+            recipe_queries = [
+                captured['sql'] for captured in queries
+                if f'FROM "{Recipe._meta.db_table}"' in captured['sql']
+            ]
+            self.assertTrue(recipe_queries)
+            for sql in recipe_queries:
+                self.assertNotIn('DISTINCT', sql.upper())
+                self.assertNotRegex(sql, rf'JOIN "?{table}"?')
+            self.assertTrue(any(
+                'EXISTS' in sql.upper() and table in sql
+                for sql in recipe_queries
+            ))
+
+    def test_combined(self):
+        self.assertEqual(
+            self.get_ids('tags=lunch&is_in_shopping_cart=1'), {self.lunch.id}
+        )
+        self.assertEqual(self.get_ids('tags=lunch&is_favorited=1'), set())
+
+
+class RecipeActionTest(APITestCase):
+    """
+    Повторное добавление и удаление рецепта (двойной клик) не меняет
+    счетчики и суммы списка покупок второй раз.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe = create_recipes(
+            cls.author, 1, cls.tags, cls.ingredients
+        )[0]
+
+    def get_state(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        totals = {
+            row.ingredient_id: row.amount
+            for row in ShoppingCartAggregate.objects.filter(user=self.user)
+            if row.amount
+        }
+        return recipe.favorites_count, recipe.carts_count, totals
+
+    def test_repeated_requests(self):
+        added = (1, 1, {ingredient.id: 5 for ingredient in self.ingredients})
+        for method, status, state in (
+            ('post', 201, added), ('post', 400, added),
+            ('delete', 204, (0, 0, {})), ('delete', 400, (0, 0, {})),
+        ):
+            with self.subTest(method=method, status=status):
+                for action in ('favorite', 'shopping_cart'):
+                    response = getattr(self.client, method)(
+                        f'/api/recipes/{self.recipe.id}/{action}/'
+                    )
+                    self.assertEqual(response.status_code, status)
+                self.assertEqual(self.get_state(), state)
+
+    def test_row_added_by_concurrent_request(self):
+        # Строку успела добавить параллельная транзакция
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_state(), (0, 0, {}))
+
+
+class RankedOrderingTest(APITestCase):
+    """Рецепты без рассчитанного рейтинга остаются в ленте."""
+
+    def test_recipes_without_score(self):
+        scored, unscored = create_recipes(
+            self.author, 2, self.tags, self.ingredients
+        )
+        self.client.post(f'/api/recipes/{scored.id}/favorite/')
+        update_recipe_scores(full=True)
+        RecipeScore.objects.filter(recipe=unscored).delete()
+        for ordering in ('popular', 'trending'):
+            with self.subTest(ordering=ordering):
+                response = self.client.get(
+                    f'{RECIPES_URL}&ordering={ordering}'
+                )
+                self.assertEqual(
+                    [recipe['id'] for recipe in response.data['results']],
+                    [scored.id, unscored.id]
+                )
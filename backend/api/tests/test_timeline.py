@@ -0,0 +1,52 @@
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from api.timeline import fan_out_recipe
+from recipes.models import CustomUser, TimelineEntry
+
+from .base import APITestCase, create_recipes, create_user
+
+
+@override_settings(FEED_FAN_OUT_MAX_FOLLOWERS=1)
+class TimelineTest(APITestCase):
+    """Ленты подписок при переходе автора через порог популярности."""
+
+    def get_client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def get_feed_ids(self):
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_popular_author_recipes_kept_after_unsubscribe(self):
+        # Объект автора загружен до подписок, как закешированный
+        # request.user: в нем followers_count=0
+        stale_author = CustomUser.objects.get(pk=self.author.pk)
+        other = self.get_client(create_user('other'))
+        url = f'/api/users/{self.author.id}/subscribe/'
+        for client in (self.client, other):
+            self.assertEqual(client.post(url).status_code, 201)
+
+        recipe = create_recipes(
+            stale_author, 1, self.tags, self.ingredients
+        )[0]
+        self.assertEqual(fan_out_recipe(recipe), 0)
+        self.assertFalse(TimelineEntry.objects.filter(recipe=recipe).exists())
+        self.assertEqual(self.get_feed_ids(), [recipe.id])
+
+        # Автор перестал быть популярным: рецепт, опубликованный
+        # без раскладки, добавляется в ленты оставшихся подписчиков
+        self.assertEqual(other.delete(url).status_code, 204)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, recipe=recipe
+        ).exists())
+        self.assertEqual(self.get_feed_ids(), [recipe.id])
+
+        new_recipe = create_recipes(
+            stale_author, 1, self.tags, self.ingredients
+        )[0]
+        self.assertEqual(fan_out_recipe(new_recipe), 1)
+        self.assertEqual(self.get_feed_ids(), [new_recipe.id, recipe.id])
@@ -0,0 +1,102 @@
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.versions import get_model_version
+from recipes.models import CustomUser, Ingredient, Recipe, Tag
+
+from .base import APITestCase, clear_caches, create_recipes
+
+
+class CatalogueVersionTest(TestCase):
+    """Версия справочника меняется только после фиксации транзакции."""
+
+    def setUp(self):
+        clear_caches()
+
+    def test_version_bumped_on_commit(self):
+        for model, create in (
+            (Tag, lambda: Tag.objects.create(name='Ужин', slug='dinner')),
+            (Ingredient, lambda: Ingredient.objects.create(
+                name='Сахар', measurement_unit='г'
+            )),
+        ):
+            with self.subTest(model=model.__name__):
+                version = get_model_version(model)
+                with self.captureOnCommitCallbacks(execute=True):
+                    create()
+                    self.assertEqual(get_model_version(model), version)
+                self.assertGreater(get_model_version(model), version)
+
+    def test_version_not_evicted_by_other_caches(self):
+        version = get_model_version(Tag)
+        # Раньше версии хранились в default с пределом в 300 записей
+        for alias, count in (
+            ('default', 300), ('responses', caches['responses']._max_entries)
+        ):
+            caches[alias].set_many({
+                f'filler:{number}': number for number in range(count + 1)
+            })
+        self.assertEqual(get_model_version(Tag), version)
+
+
+def bump_in_other_process(model):
+    """
+    Меняет версию модели в отдельном процессе, как команда управления
+    (import_ingredients, update_recipe_scores) при работающем gunicorn.
+    """
+    subprocess.run(
+        [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'shell',
+            '-c',
+            'from api.versions import bump_model_version; '
+            f'from {model.__module__} import {model.__name__}; '
+            f'bump_model_version({model.__name__})'
+        ],
+        check=True
+    )
+
+
+class SharedVersionTest(APITestCase):
+    """Версии, измененные в другом процессе, видны процессу API."""
+
+    def test_etag_changes(self):
+        client = APIClient()
+        etag = client.get('/api/tags/')['ETag']
+        self.assertEqual(client.get('/api/tags/')['ETag'], etag)
+        bump_in_other_process(Tag)
+        self.assertNotEqual(client.get('/api/tags/')['ETag'], etag)
+
+    def test_cached_response_refreshed(self):
+        recipe = create_recipes(self.author, 1, self.tags, self.ingredients)[0]
+        client = APIClient()
+        url = f'/api/recipes/{recipe.id}/'
+        self.assertEqual(client.get(url).json()['name'], recipe.name)
+        # Запись без сигналов, версию меняет другой процесс
+        Recipe.objects.filter(pk=recipe.pk).update(name='Новое название')
+        self.assertEqual(client.get(url).json()['name'], recipe.name)
+        bump_in_other_process(Recipe)
+        self.assertEqual(client.get(url).json()['name'], 'Новое название')
+
+
+class AuthorVersionTest(APITestCase):
+    """Кеш рецептов сбрасывают только поля автора, которые в нем есть."""
+
+    def save_user(self, **kwargs):
+        user = CustomUser.objects.get(pk=self.author.pk)
+        version = get_model_version(Recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(**kwargs)
+        return get_model_version(Recipe) != version
+
+    def test_rendered_fields_bump_recipes(self):
+        self.assertTrue(self.save_user(update_fields=['first_name']))
+        self.assertTrue(self.save_user())
+
+    def test_other_fields_keep_recipes(self):
+        self.assertFalse(self.save_user(update_fields=['password']))
+        self.assertFalse(self.save_user(update_fields=['last_login']))
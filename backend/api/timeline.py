@@ -0,0 +1,137 @@
+from django.conf import settings
+
+from recipes.models import CustomUser, Recipe, Subscription, TimelineEntry
+
+from .importers import IMPORT_BATCH_SIZE, iter_chunks
+from .utils import get_recent_recipes
+
+
+def get_fan_out_authors():
+    """
+    Авторы, рецепты которых раскладываются по лентам подписчиков:
+    не больше FEED_FAN_OUT_MAX_FOLLOWERS подписчиков. Ленты подписчиков
+    популярных авторов дополняются их рецептами при чтении (fan-out
+    on read). Число подписчиков берется из базы в том же запросе,
+    а не из загруженного ранее объекта автора (например, request.user).
+    """
+    return CustomUser.objects.filter(
+        followers_count__lte=settings.FEED_FAN_OUT_MAX_FOLLOWERS
+    )
+
+
+def fan_out_recipe(recipe, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Добавляет рецепт в ленты подписчиков автора.
+    Возвращает количество подписчиков или 0 для популярного автора.
+    """
+    # Подписчиков не больше FEED_FAN_OUT_MAX_FOLLOWERS
+    follower_ids = list(
+        Subscription.objects.filter(
+            author_id=recipe.author_id,
+            author__in=get_fan_out_authors().values('pk')
+        ).values_list('follower_id', flat=True).order_by()
+    )
+    for chunk in iter_chunks(follower_ids, batch_size):
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(
+                    user_id=follower_id,
+                    recipe_id=recipe.id,
+                    created_at=recipe.created_at
+                )
+                for follower_id in chunk
+            ),
+            ignore_conflicts=True
+        )
+    return len(follower_ids)
+
+
+def backfill_timelines(subscriptions, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Добавляет в ленты подписчиков последние FEED_BACKFILL_RECIPES
+    рецептов авторов, на которых они подписались.
+    subscriptions — пары (id подписчика, id автора); рецепты популярных
+    авторов не выбираются, они подмешиваются при чтении.
+    """
+    subscriptions = list(subscriptions)
+    if not subscriptions:
+        return
+    recipes_by_author = get_recent_recipes(
+        get_fan_out_authors().filter(
+            pk__in={author_id for _, author_id in subscriptions}
+        ).values('pk'),
+        settings.FEED_BACKFILL_RECIPES,
+        fields=('id', 'author', 'created_at')
+    )
+    entries = (
+        TimelineEntry(
+            user_id=follower_id,
+            recipe_id=recipe.id,
+            created_at=recipe.created_at
+        )
+        for follower_id, author_id in subscriptions
+        for recipe in recipes_by_author[author_id]
+    )
+    for chunk in iter_chunks(entries, batch_size):
+        TimelineEntry.objects.bulk_create(chunk, ignore_conflicts=True)
+
+
+def backfill_after_unsubscribe(author_id, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Вызывается после уменьшения followers_count автора. Если автор
+    перестал быть популярным (подписчиков стало ровно
+    FEED_FAN_OUT_MAX_FOLLOWERS), его рецепты больше не подмешиваются
+    при чтении, а опубликованные за это время не были разложены
+    по лентам: в ленты всех подписчиков добавляются последние
+    FEED_BACKFILL_RECIPES рецептов автора. Обратный переход не требует
+    действий: записи лент остаются, а совпадающие с подмешанными
+    рецепты FeedPagination объединяет.
+    """
+    follower_ids = Subscription.objects.filter(
+        author_id=author_id,
+        author__followers_count=settings.FEED_FAN_OUT_MAX_FOLLOWERS
+    ).values_list('follower_id', flat=True).order_by()
+    backfill_timelines(
+        ((follower_id, author_id) for follower_id in follower_ids.iterator()),
+        batch_size
+    )
+
+
+def remove_author_from_timeline(user, author):
+    """Удаляет рецепты автора из ленты пользователя после отписки."""
+    TimelineEntry.objects.filter(
+        user=user,
+        recipe__in=Recipe.objects.filter(author=author).values('id')
+    ).delete()
+
+
+def get_timeline_sources(user):
+    """
+    Источники ленты подписок для FeedPagination: записи ленты
+    пользователя и рецепты популярных авторов, на которых он подписан.
+    Каждый источник — (queryset, поле id рецепта).
+    """
+    pulled_authors = Subscription.objects.filter(
+        follower=user,
+        author__followers_count__gt=settings.FEED_FAN_OUT_MAX_FOLLOWERS
+    ).values('author_id')
+    return (
+        (TimelineEntry.objects.filter(user=user), 'recipe_id'),
+        (Recipe.objects.filter(author__in=pulled_authors), 'id'),
+    )
+
+
+def rebuild_timelines(batch_size=IMPORT_BATCH_SIZE):
+    """
+    Заполняет ленты подписок по всем подпискам: последние
+    FEED_BACKFILL_RECIPES рецептов каждого автора. Существующие записи
+    сохраняются. Возвращает количество обработанных подписок.
+    """
+    subscriptions = Subscription.objects.order_by('id').values_list(
+        'follower_id', 'author_id'
+    )
+    count = 0
+    for chunk in iter_chunks(subscriptions.iterator(), batch_size):
+        backfill_timelines(chunk, batch_size)
+        count += len(chunk)
+    return count
@@ -1,81 +1,203 @@
-import csv
 from collections import defaultdict
-from http import HTTPStatus
 
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Window
+from django.db.models.functions import Coalesce, Greatest, RowNumber
 
-from recipes.models import CustomUser, Ingredient, IngredientInRecipe
+from recipes.models import (CustomUser, Favorite, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingCartAggregate, Subscription)
 
+# Денормализованные счетчики:
+# (модель, поле счетчика, связанная модель, поле связи)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'carts_count', ShoppingCart, 'recipe'),
+    (CustomUser, 'recipes_count', Recipe, 'author'),
+    (CustomUser, 'followers_count', Subscription, 'author'),
+)
+# Поля рецептов, которые выводятся в подписках
+RECENT_RECIPE_FIELDS = (
+    'id', 'author', 'name', 'image', 'image_renditions', 'cooking_time'
+)
 
-def generate_shopping_list(user):
-    """Генерация списка покупок для текущего пользователя."""
 
-    if not user.is_authenticated:
-        return HttpResponse(
-            'Вы не авторизованы!', status=HTTPStatus.UNAUTHORIZED
+def get_recent_recipes(author_ids, recipes_limit=None,
+                       fields=RECENT_RECIPE_FIELDS):
+    """
+    Возвращает словарь {id автора: [рецепты]} с последними рецептами
+    каждого автора. Все авторы обрабатываются одним запросом: рецепты
+    нумеруются ROW_NUMBER() OVER (PARTITION BY author_id) и отсекаются
+    по recipes_limit. Загружаются только поля fields.
+    """
+    recipes = Recipe.objects.filter(author_id__in=author_ids).only(*fields)
+    if not recipes_limit:
+        recipes = recipes.order_by('-created_at', '-id')
+    else:
+        sql, params = recipes.annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('created_at').desc(), F('id').desc()]
+            )
+        ).order_by().query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) AS ranked '
+            'WHERE ranked.row_number <= %s ORDER BY ranked.row_number',
+            (*params, recipes_limit)
         )
 
-    # Собираем список рецептов, добавленных в список покупок пользователя
-    shopping_cart = user.shopping_cart.all()
+    recipes_by_author = defaultdict(list)
+    for recipe in recipes:
+        recipes_by_author[recipe.author_id].append(recipe)
+    return recipes_by_author
+
 
-    # Хранилище для ингредиентов и их сумм
-    ingredients = defaultdict(
-        lambda: {'name': '', 'measurement_unit': '', 'amount': 0}
+def prefetch_subscription_recipes(subscriptions, recipes_limit=None):
+    """
+    Подгружает последние рецепты авторов для страницы подписок,
+    чтобы сериализатор не обращался к базе для каждого автора.
+    """
+    recipes_by_author = get_recent_recipes(
+        [subscription.author_id for subscription in subscriptions],
+        recipes_limit
     )
+    for subscription in subscriptions:
+        subscription.recent_recipes = recipes_by_author[
+            subscription.author_id
+        ]
+        # Подписки выбраны по текущему пользователю
+        subscription.author.is_subscribed = True
 
-    # Проходим по каждому рецепту в списке покупок
-    ingredients = (
-        IngredientInRecipe.objects.filter(recipe__in=shopping_cart)
-        .values(
-            'ingredient_id',  # ID ингредиента
-            'ingredient__name',  # Имя ингредиента
-            'ingredient__measurement_unit'  # Единица измерения
+
+def get_recipe_amounts(recipe):
+    """Возвращает словарь {id ингредиента: количество} для рецепта."""
+    return dict(
+        IngredientInRecipe.objects.filter(recipe=recipe).values_list(
+            'ingredient_id', 'amount'
         )
-        .annotate(total_amount=Sum('amount'))  # Суммируем количество
-        .order_by('ingredient__name')  # Сортируем по имени ингредиента
     )
 
-    # Формируем текст для списка покупок
-    shopping_list_text = 'Ваш список покупок:\n\n'
-    for ingredient in ingredients:
-        shopping_list_text += (
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]}) — '
-            f'{ingredient["total_amount"]}\n'
+
+def update_shopping_cart_totals(user_ids, deltas):
+    """
+    Применяет изменения количества ингредиентов {id ингредиента: разница}
+    к суммам списков покупок пользователей.
+    Строки пользователей блокируются, чтобы параллельные изменения одного
+    списка покупок не теряли обновления.
+    """
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    user_ids = list(user_ids)
+    if not deltas or not user_ids:
+        return
+
+    with transaction.atomic():
+        list(
+            CustomUser.objects.select_for_update()
+            .filter(id__in=user_ids).order_by('id').values_list('id')
         )
+        existing = {
+            (total.user_id, total.ingredient_id): total
+            for total in ShoppingCartAggregate.objects.filter(
+                user_id__in=user_ids, ingredient_id__in=deltas
+            )
+        }
+        to_create, to_update, to_delete = [], [], []
+        for user_id in user_ids:
+            for ingredient_id, delta in deltas.items():
+                total = existing.get((user_id, ingredient_id))
+                if total is None:
+                    if delta > 0:
+                        to_create.append(ShoppingCartAggregate(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            amount=delta
+                        ))
+                    continue
+                total.amount += delta
+                if total.amount > 0:
+                    to_update.append(total)
+                else:
+                    to_delete.append(total.id)
 
-    return shopping_list_text
+        ShoppingCartAggregate.objects.bulk_create(to_create)
+        ShoppingCartAggregate.objects.bulk_update(to_update, ['amount'])
+        if to_delete:
+            ShoppingCartAggregate.objects.filter(id__in=to_delete).delete()
 
 
-def load_ingredients_from_csv(file_path):
+def add_recipe_to_shopping_cart_totals(user_ids, recipe, sign=1):
     """
-    Загружает ингредиенты из CSV-файла в базу данных.
+    Добавляет ингредиенты рецепта к суммам списков покупок
+    (sign=-1 — вычитает их).
     """
-    with open(file_path, encoding='utf-8') as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            name, measurement_unit = row
-            Ingredient.objects.get_or_create(
-                name=name.strip(),
-                measurement_unit=measurement_unit.strip()
-            )
+    update_shopping_cart_totals(user_ids, {
+        ingredient_id: sign * amount
+        for ingredient_id, amount in get_recipe_amounts(recipe).items()
+    })
+
+
+def calculate_shopping_cart_totals():
+    """
+    Пересчитывает суммы списков покупок по исходным таблицам.
+    Возвращает словарь {(id пользователя, id ингредиента): количество}.
+    """
+    totals = (
+        ShoppingCart.objects
+        .values(
+            'user_id',
+            ingredient_id=F('recipe__ingredient_in_recipe__ingredient_id')
+        )
+        .filter(ingredient_id__isnull=False)
+        .annotate(amount=Sum('recipe__ingredient_in_recipe__amount'))
+        .order_by()
+    )
+    return {
+        (row['user_id'], row['ingredient_id']): row['amount']
+        for row in totals.iterator()
+    }
 
 
-def load_users_from_csv(file_path):
+def change_counter(model, pk, field, delta):
     """
-    Загружает пользователей из CSV-файла в базу данных.
-    Формат CSV: first_name, last_name, username, email, password
+    Атомарно изменяет денормализованный счетчик одним UPDATE
+    (field = field + delta), не опускаясь ниже нуля.
     """
-    with open(file_path, encoding='utf-8') as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            first_name, last_name, username, email, password = row
-            if not CustomUser.objects.filter(username=username).exists():
-                CustomUser.objects.create_user(
-                    username=username.strip(),
-                    email=email.strip(),
-                    password=password.strip(),
-                    first_name=first_name.strip(),
-                    last_name=last_name.strip()
-                )
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def get_actual_count(related_model, related_field):
+    """Подзапрос, считающий связанные записи для OuterRef('pk')."""
+    return Coalesce(
+        Subquery(
+            related_model.objects
+            .filter(**{related_field: OuterRef('pk')})
+            .order_by().values(related_field)
+            .annotate(count=Count('pk')).values('count')
+        ),
+        0
+    )
+
+
+def reconcile_counters(verify_only=False):
+    """
+    Сверяет денормализованные счетчики с исходными таблицами
+    и, если verify_only=False, исправляет расхождения.
+    Возвращает словарь {'Модель.поле': число строк с расхождением}.
+    """
+    drift = {}
+    for model, field, related_model, related_field in COUNTERS:
+        actual_count = get_actual_count(related_model, related_field)
+        drifted = model.objects.annotate(
+            actual_count=actual_count
+        ).exclude(**{field: F('actual_count')}).values('pk')
+        drift[f'{model.__name__}.{field}'] = drifted.count()
+        if not verify_only and drift[f'{model.__name__}.{field}']:
+            model.objects.filter(pk__in=drifted).update(
+                **{field: actual_count}
+            )
+    return drift
@@ -0,0 +1,88 @@
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+
+VERSION_KEY_PREFIX = 'model_version'
+# Отдельный кеш: версии не вытесняются фрагментами и ответами
+VERSION_CACHE_ALIAS = 'versions'
+
+
+def _cache():
+    return caches[VERSION_CACHE_ALIAS]
+
+
+def _version_key(model):
+    return f'{VERSION_KEY_PREFIX}:{model._meta.label_lower}'
+
+
+def _object_version_key(model, pk):
+    return f'{_version_key(model)}:{pk}'
+
+
+def get_model_version(model):
+    """
+    Текущая версия данных модели — время последнего изменения
+    в наносекундах. Хранится в общем кеше, поэтому одинакова
+    во всех процессах.
+    """
+    key = _version_key(model)
+    version = _cache().get(key)
+    if version is None:
+        _cache().add(key, time.time_ns(), timeout=None)
+        version = _cache().get(key)
+    return version
+
+
+def bump_model_version(model):
+    """Меняет версию данных модели после записи."""
+    version = max(time.time_ns(), get_model_version(model) + 1)
+    _cache().set(_version_key(model), version, timeout=None)
+    return version
+
+
+def get_model_versions(models):
+    """Версии данных нескольких моделей одним обращением к кешу."""
+    keys = [_version_key(model) for model in models]
+    versions = _cache().get_many(keys)
+    return tuple(
+        versions[key] if key in versions else get_model_version(model)
+        for key, model in zip(keys, models)
+    )
+
+
+def bump_model_version_on_commit(model):
+    """
+    Меняет версию данных модели после фиксации транзакции, чтобы
+    параллельный запрос не закешировал под новой версией старые данные.
+    """
+    transaction.on_commit(lambda: bump_model_version(model))
+
+
+def get_object_versions(objects):
+    """
+    Версии данных объектов одним обращением к кешу.
+    objects — пары (модель, pk), результат — словарь {(модель, pk): версия}.
+    Отсутствующим в кеше объектам назначается новая версия, поэтому
+    после вытеснения версии старые данные под ней не используются.
+    """
+    keys = {
+        (model, pk): _object_version_key(model, pk) for model, pk in objects
+    }
+    versions = _cache().get_many(keys.values())
+    missing = {
+        key: time.time_ns() for key in keys.values() if key not in versions
+    }
+    if missing:
+        _cache().set_many(missing, timeout=None)
+        versions.update(missing)
+    return {obj: versions[key] for obj, key in keys.items()}
+
+
+def bump_object_versions_on_commit(model, pks):
+    """Меняет версии данных объектов после фиксации транзакции."""
+    keys = [_object_version_key(model, pk) for pk in pks]
+    if keys:
+        transaction.on_commit(lambda: _cache().set_many(
+            dict.fromkeys(keys, time.time_ns()), timeout=None
+        ))
@@ -1,5 +1,9 @@
-import hashlib
-
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http import Http404, HttpResponse, HttpResponsePermanentRedirect
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework.authtoken.models import Token
@@ -10,17 +14,41 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet, ViewSet
 
-from .filters import RecipeFilter
-from .pagination import MainPagePagination
+from .exporters import SHOPPING_LIST_EXPORTERS, get_shopping_list_rows
+from .filters import RANKED_ORDERINGS, RecipeFilter
+from .fragments import render_recipe_page
+from .images import schedule_renditions
+from .metrics import registry
+from .mixins import AnonymousResponseCacheMixin, ConditionalGetMixin
+from .pagination import (FeedPagination, MainPagePagination,
+                         RecipeKeysetPagination)
 from .permissions import IsAuthorOrAdmin
+from .search import get_ingredient_search
 from .serializers import (AvatarSerializer, CustomUserCreateSerializer,
                           CustomUserSerializer, IngredientSerializer,
                           RecipeCreateUpdateSerializer, RecipeListSerializer,
                           RecipeMinifiedSerializer, SetPasswordSerializer,
                           SubscriptionSerializer, TagSerializer,
-                          TokenLoginSerializer)
-from .utils import generate_shopping_list
-from recipes.models import CustomUser, Ingredient, Recipe, Subscription, Tag
+                          TokenLoginSerializer, get_sparse_fields)
+from .shortlinks import get_short_link_code, hit_buffer, resolve_short_link
+from .timeline import (backfill_after_unsubscribe, backfill_timelines,
+                       get_timeline_sources, remove_author_from_timeline)
+from .utils import (add_recipe_to_shopping_cart_totals, change_counter,
+                    prefetch_subscription_recipes)
+from recipes.models import (CustomUser, Favorite, Ingredient,
+                            IngredientInRecipe, Recipe, RecipeScore,
+                            ShoppingCart, Subscription, Tag)
+
+# Счетчики рецепта, которые меняются при добавлении в избранное
+# и список покупок
+ACTION_COUNTERS = {
+    'favorites': 'favorites_count',
+    'shopping_cart': 'carts_count',
+}
+ACTION_MODELS = {
+    'favorites': Favorite,
+    'shopping_cart': ShoppingCart,
+}
 
 
 class UserViewSet(ModelViewSet):
@@ -44,6 +72,22 @@ class UserViewSet(ModelViewSet):
             return [AllowAny()]
         return super().get_permissions()
 
+    def get_queryset(self):
+        """
+        Для списка и профиля аннотирует флаг подписки текущего
+        пользователя, чтобы сериализатор не проверял его отдельным
+        запросом для каждого пользователя.
+        """
+        queryset = super().get_queryset()
+        user = self.request.user
+        if self.action in ('list', 'retrieve') and user.is_authenticated:
+            queryset = queryset.annotate(
+                is_subscribed=Exists(Subscription.objects.filter(
+                    author=OuterRef('pk'), follower=user
+                ))
+            )
+        return queryset
+
     def create(self, request, *args, **kwargs):
         """Переопределяет метод для возврата полного ответа с id
         после создания пользователя."""
@@ -60,7 +104,7 @@ class UserViewSet(ModelViewSet):
 
     def list(self, request,):
         """Список пользователей."""
-        queryset = CustomUser.objects.all()
+        queryset = self.get_queryset()
         paginator = MainPagePagination()
         page = paginator.paginate_queryset(queryset, request)
         serializer = CustomUserSerializer(
@@ -95,12 +139,18 @@ class UserViewSet(ModelViewSet):
         serializer.is_valid(raise_exception=True)
         user = request.user
         user.set_password(serializer.validated_data['new_password'])
-        user.save()
+        user.save(update_fields=['password'])
         return Response(
             {'detail': 'Пароль успешно изменен'},
             status=status.HTTP_204_NO_CONTENT
         )
 
+    def _get_subscriptions(self, follower):
+        """Подписки пользователя вместе с авторами."""
+        return Subscription.objects.filter(
+            follower=follower
+        ).select_related('author').order_by('id')
+
     @action(detail=False,
             methods=['get'],
             url_path='subscriptions',
@@ -108,8 +158,7 @@ class UserViewSet(ModelViewSet):
             pagination_class=MainPagePagination)
     def subscriptions(self, request):
         """Получение списка подписок пользователя."""
-        user = request.user
-        subscriptions = user.subscriptions.all()
+        subscriptions = self._get_subscriptions(request.user)
 
         # Извлечение параметра recipes_limit
         recipes_limit = request.query_params.get('recipes_limit', None)
@@ -124,6 +173,7 @@ class UserViewSet(ModelViewSet):
 
         page = self.paginate_queryset(subscriptions)
         if page is not None:
+            prefetch_subscription_recipes(page, recipes_limit)
             serializer = SubscriptionSerializer(
                 page,
                 many=True,
@@ -131,6 +181,8 @@ class UserViewSet(ModelViewSet):
             )
             return self.get_paginated_response(serializer.data)
 
+        subscriptions = list(subscriptions)
+        prefetch_subscription_recipes(subscriptions, recipes_limit)
         serializer = SubscriptionSerializer(
             subscriptions,
             many=True,
@@ -154,15 +206,6 @@ class UserViewSet(ModelViewSet):
             )
 
         if request.method == 'POST':
-            if request.user.subscriptions.filter(author=author).exists():
-                return Response(
-                    {'detail': 'Вы уже подписаны на этого пользователя'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            Subscription.objects.create(follower=request.user, author=author)
-
-            # Формирование ответа
             recipes_limit = request.query_params.get('recipes_limit', None)
             if recipes_limit is not None:
                 try:
@@ -172,35 +215,52 @@ class UserViewSet(ModelViewSet):
                         {'detail': 'recipes_limit должен быть числом'},
                         status=status.HTTP_400_BAD_REQUEST
                     )
-            # Создание подписки через сериализатор
-            serializer = SubscriptionSerializer(
-                data={'follower': request.user, 'author': author},
-                context={'request': request, 'recipes_limit': recipes_limit}
-            )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
 
+            # Счетчик и ленты меняются, только если подписка создана
+            # этим запросом, а не параллельным
+            with transaction.atomic():
+                subscription, created = Subscription.objects.get_or_create(
+                    follower=request.user, author=author
+                )
+                if created:
+                    change_counter(
+                        CustomUser, author.pk, 'followers_count', 1
+                    )
+                    backfill_timelines([(request.user.pk, author.pk)])
+            if not created:
+                return Response(
+                    {'detail': 'Вы уже подписаны на этого пользователя'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            # Формирование ответа
+            prefetch_subscription_recipes([subscription], recipes_limit)
             serializer = SubscriptionSerializer(
-                Subscription.objects.get(author=author, follower=request.user),
+                subscription,
                 context={'request': request, 'recipes_limit': recipes_limit}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         elif request.method == 'DELETE':
-            try:
-                subscription = Subscription.objects.get(
+            with transaction.atomic():
+                deleted, _ = Subscription.objects.filter(
                     author=author, follower=request.user
-                )
-                subscription.delete()
-                return Response(
-                    {'detail': 'Подписка успешно удалена.'},
-                    status=status.HTTP_204_NO_CONTENT
-                )
-            except Subscription.DoesNotExist:
+                ).delete()
+                if deleted:
+                    change_counter(
+                        CustomUser, author.pk, 'followers_count', -1
+                    )
+                    remove_author_from_timeline(request.user, author)
+                    backfill_after_unsubscribe(author.pk)
+            if not deleted:
                 return Response(
                     {'detail': 'Вы не подписаны на этого пользователя.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            return Response(
+                {'detail': 'Подписка успешно удалена.'},
+                status=status.HTTP_204_NO_CONTENT
+            )
 
         return Response(
             {'detail': 'Метод не поддерживается'},
@@ -220,17 +280,23 @@ class UserViewSet(ModelViewSet):
             )
             serializer.is_valid(raise_exception=True)
             user = request.user
+            previous_avatar = user.avatar.name
             user.avatar = serializer.validated_data['avatar']
-            user.save()
+            user.save(update_fields=['avatar'])
+            # Повторно загруженный аватар не записывается заново
+            # (ContentAddressedStorage), копии для него уже есть
+            if user.avatar.name != previous_avatar:
+                schedule_renditions(user)
             return Response(
                 {'avatar': user.avatar.url},
                 status=status.HTTP_200_OK
             )
         elif request.method == 'DELETE':
             user = request.user
-            user.avatar.delete()
+            # Файл может быть общим с другими пользователями, его
+            # удалит collect_media_garbage
             user.avatar = None
-            user.save()
+            user.save(update_fields=['avatar'])
             return Response(
                 {'detail': 'Аватар успешно удален'},
                 status=status.HTTP_204_NO_CONTENT
@@ -273,20 +339,27 @@ class AuthTokenViewSet(ViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
     """ViewSet для управления тегами."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(AnonymousResponseCacheMixin, ModelViewSet):
     """ViewSet для управления рецептами."""
     queryset = Recipe.objects.all().order_by('-created_at')
     serializer_class = RecipeListSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
     pagination_class = None
+    response_cache_models = (Recipe, Tag, Ingredient)
+    # is_favorited и is_in_shopping_cart не действуют для анонимных
+    response_cache_params = (
+        'tags', 'author', 'limit', 'page', 'ordering', 'pagination', 'cursor',
+        'fields'
+    )
+    response_cache_multi_params = ('tags',)
 
     def get_serializer_class(self):
         """Определяет сериализатор в зависимости от действия."""
@@ -304,40 +377,199 @@ class RecipeViewSet(ModelViewSet):
             return [IsAuthenticated(), IsAuthorOrAdmin()]
         return super().get_permissions()
 
+    def get_queryset(self):
+        """
+        Для списка и детального просмотра подгружает связанные объекты
+        пачкой и аннотирует флаги текущего пользователя, чтобы сериализатор
+        не делал запросов на каждый рецепт.
+        """
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve', 'feed'):
+            return queryset
+        if self.use_fragments():
+            # Остальное берется из кеша фрагментов (render_recipe_page)
+            return queryset.only('id', 'author', 'created_at')
+        # Связанные объекты полей, исключенных параметром fields,
+        # не загружаются
+        fields = get_sparse_fields(self.request)
+        if fields is None or 'author' in fields:
+            queryset = queryset.select_related('author')
+        if fields is None or 'tags' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.all())
+            )
+        if fields is None or 'ingredients' in fields:
+            queryset = queryset.prefetch_related(Prefetch(
+                'ingredient_in_recipe',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            ))
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset
+        queryset = queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            )
+        )
+        if fields is None or 'author' in fields:
+            queryset = queryset.annotate(author_is_subscribed=Exists(
+                Subscription.objects.filter(
+                    follower=user, author=OuterRef('author')
+                )
+            ))
+        return queryset
+
+    def use_fragments(self):
+        """
+        Страницы рецептов авторизованного пользователя собираются
+        из кеша фрагментов.
+        """
+        return (
+            settings.RECIPE_FRAGMENT_CACHE
+            and self.action in ('list', 'feed')
+            and self.request.user.is_authenticated
+        )
+
+    def get_serializer_context(self):
+        """Поля, выбранные параметром fields (?fields=id,name,image)."""
+        context = super().get_serializer_context()
+        context['fields'] = get_sparse_fields(self.request)
+        return context
+
+    def get_page_data(self, page, request):
+        """Представление страницы рецептов."""
+        if self.use_fragments():
+            return render_recipe_page(
+                page, request, get_sparse_fields(request)
+            )
+        return RecipeListSerializer(
+            page,
+            many=True,
+            context=self.get_serializer_context()
+        ).data
+
+    def perform_content_negotiation(self, request, force=False):
+        """
+        У выгрузки списка покупок параметр format выбирает формат файла,
+        а не рендерер DRF, поэтому неизвестный рендереру формат не
+        должен приводить к 404.
+        """
+        if self.action == 'download_shopping_cart':
+            force = True
+        return super().perform_content_negotiation(request, force)
+
+    def get_feed_paginator(self, request):
+        """
+        Пагинатор ленты: курсорный при pagination=cursor или переданном
+        курсоре, иначе постраничный. Ранжированная лента (ordering)
+        всегда постраничная: курсор построен по дате публикации.
+        """
+        if request.query_params.get('ordering') in RANKED_ORDERINGS:
+            return MainPagePagination()
+        if (request.query_params.get('pagination') == 'cursor'
+                or 'cursor' in request.query_params):
+            return RecipeKeysetPagination()
+        return MainPagePagination()
+
+    def get_response_cache_models(self, request):
+        """Ранжированная лента зависит и от рейтингов рецептов."""
+        if request.query_params.get('ordering') in RANKED_ORDERINGS:
+            return self.response_cache_models + (RecipeScore,)
+        return self.response_cache_models
+
     def list(self, request):
+        """Список рецептов, для анонимных — из кеша ответов."""
+        return self.cached_response(request, self.list_recipes)
+
+    def list_recipes(self, request):
         """Список рецептов."""
         queryset = self.filter_queryset(self.get_queryset())
-        paginator = MainPagePagination()
+        paginator = self.get_feed_paginator(request)
         page = paginator.paginate_queryset(queryset, request)
-        serializer = RecipeListSerializer(
-            page,
-            many=True,
-            context={'request': request}
+        return paginator.get_paginated_response(
+            self.get_page_data(page, request)
         )
-        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь,
+        с курсорной пагинацией. Читается из записей ленты подписок,
+        рецепты популярных авторов подмешиваются при чтении.
+        """
+        paginator = FeedPagination()
+        page = paginator.paginate_sources(
+            get_timeline_sources(request.user), self.get_queryset(), request
+        )
+        return paginator.get_paginated_response(
+            self.get_page_data(page, request)
+        )
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        """Удаляет рецепт и вычитает его из сумм списков покупок."""
+        add_recipe_to_shopping_cart_totals(
+            instance.in_shopping_cart.values_list('user_id', flat=True),
+            instance,
+            sign=-1
+        )
+        instance.delete()
+        change_counter(CustomUser, instance.author_id, 'recipes_count', -1)
 
     def handle_action(self, request, pk, action_type):
-        """Общий метод для обработки добавления и удаления рецептов."""
+        """
+        Общий метод для обработки добавления и удаления рецептов.
+        Счетчик и суммы списка покупок меняются, только если строка
+        действительно добавлена или удалена: при повторном запросе
+        (двойной клик) параллельный запрос ждет блокировки строки
+        и ничего не меняет.
+        """
         recipe = get_object_or_404(Recipe, pk=pk)
-        user_action = getattr(request.user, action_type)
+        model = ACTION_MODELS[action_type]
+        counter = ACTION_COUNTERS[action_type]
 
         if request.method == 'POST':
-            if user_action.filter(pk=pk).exists():
+            with transaction.atomic():
+                _, created = model.objects.get_or_create(
+                    user=request.user, recipe=recipe
+                )
+                if created:
+                    change_counter(Recipe, recipe.pk, counter, 1)
+                    if action_type == 'shopping_cart':
+                        add_recipe_to_shopping_cart_totals(
+                            [request.user.id], recipe
+                        )
+            if not created:
                 return Response(
                     {'detail': f'Рецепт уже находится в {action_type}'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            user_action.add(recipe)
             serializer = RecipeMinifiedSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         elif request.method == 'DELETE':
-            if not user_action.filter(pk=pk).exists():
+            with transaction.atomic():
+                deleted, _ = model.objects.filter(
+                    user=request.user, recipe=recipe
+                ).delete()
+                if deleted:
+                    change_counter(Recipe, recipe.pk, counter, -1)
+                    if action_type == 'shopping_cart':
+                        add_recipe_to_shopping_cart_totals(
+                            [request.user.id], recipe, sign=-1
+                        )
+            if not deleted:
                 return Response(
                     {'detail': f'Рецепт отсутствует в {action_type}'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            user_action.remove(recipe)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         return Response(
@@ -370,13 +602,21 @@ class RecipeViewSet(ModelViewSet):
             url_path='download_shopping_cart',
             permission_classes=[IsAuthenticated])
     def download_shopping_cart(self, request):
-        """Получение списка покупок."""
-        shopping_list = generate_shopping_list(request.user)
-        return Response(
-            shopping_list,
-            content_type='text/plain; charset=utf-8',
-            status=status.HTTP_200_OK
-        )
+        """
+        Получение списка покупок.
+        Формат файла задается параметром format: txt (по умолчанию),
+        csv или json.
+        """
+        export_format = request.query_params.get('format', 'txt')
+        exporter_class = SHOPPING_LIST_EXPORTERS.get(export_format)
+        if exporter_class is None:
+            return Response(
+                {'detail': 'Допустимые форматы: '
+                 f'{", ".join(SHOPPING_LIST_EXPORTERS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        rows = get_shopping_list_rows(request.user)
+        return exporter_class(rows).as_response()
 
     @action(detail=True,
             methods=['get'],
@@ -385,26 +625,54 @@ class RecipeViewSet(ModelViewSet):
     def short_link(self, request, pk=None):
         """Получение короткой ссылки на рецепт."""
         recipe = get_object_or_404(Recipe, pk=pk)
-        base_url = request.build_absolute_uri('/').strip('/')
-        unique_hash = hashlib.md5(
-            f'recipe-{recipe.id}'.encode()
-        ).hexdigest()[:3]
-        short_link = f'{base_url}/s/{unique_hash}'
+        short_link = request.build_absolute_uri(
+            reverse('short-link', args=(get_short_link_code(recipe.id),))
+        )
         response_data = {'short-link': short_link}
         return Response(response_data, status=status.HTTP_200_OK)
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
     """ViewSet для управления ингредиентами."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [AllowAny]
-    filter_backends = [SearchFilter]
-    search_fields = ['^name']
+    filter_backends = []
 
     def get_queryset(self):
-        """Получение списка ингредиентов."""
+        """
+        Получение списка ингредиентов.
+        При поиске по параметру name сначала идут ингредиенты,
+        начинающиеся с запроса, затем содержащие его.
+        """
         name = self.request.query_params.get('name')
-        if name:
-            return Ingredient.objects.filter(name__istartswith=name)
+        if name and self.action == 'list':
+            return get_ingredient_search().search(name)
         return Ingredient.objects.all()
+
+
+def short_link_redirect(request, code):
+    """
+    Переход по короткой ссылке на страницу рецепта. Код однозначно
+    соответствует рецепту, поэтому перенаправление постоянное
+    и кешируется браузером на SHORT_LINK_MAX_AGE секунд.
+    """
+    recipe_id = resolve_short_link(code)
+    if recipe_id is None:
+        raise Http404('Рецепт не найден.')
+    hit_buffer.add(recipe_id)
+    response = HttpResponsePermanentRedirect(f'/recipes/{recipe_id}')
+    patch_cache_control(
+        response, public=True, max_age=settings.SHORT_LINK_MAX_AGE
+    )
+    return response
+
+
+def metrics(request):
+    """Метрики запросов в формате Prometheus для адресов из настроек."""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -40,6 +40,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
+    'api.middleware.QueryGuardMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,6 +83,148 @@ DATABASES = {
     }
 }
 
+# Кеши default и versions общие для всех процессов gunicorn
+# и команд управления: в них хранятся версии данных и кеш токенов.
+# По умолчанию это файлы в CACHE_DIR (том в docker-compose)
+CACHE_DIR = os.getenv('CACHE_DIR', BASE_DIR / 'cache')
+
+FILE_CACHE_BACKEND = 'django.core.cache.backends.filebased.FileBasedCache'
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', FILE_CACHE_BACKEND),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', os.path.join(CACHE_DIR, 'default')
+        ),
+        'MAX_ENTRIES': os.getenv('CACHE_MAX_ENTRIES', 10000),
+    },
+    # Отрендеренные ответы API и фрагменты рецептов. Ключи содержат
+    # версии данных, поэтому кеш может быть своим у каждого процесса
+    'responses': {
+        'BACKEND': os.getenv(
+            'RESPONSE_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('RESPONSE_CACHE_LOCATION', 'responses'),
+        'MAX_ENTRIES': os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 20000),
+    },
+    # Версии данных (api.versions). Вытесненная версия создается заново
+    # и сбрасывает все зависящие от нее ETag и фрагменты, поэтому версии
+    # хранятся отдельно от вытесняемых записей; записей должно хватать
+    # на все рецепты и пользователей
+    'versions': {
+        'BACKEND': os.getenv('VERSION_CACHE_BACKEND', FILE_CACHE_BACKEND),
+        'LOCATION': os.getenv(
+            'VERSION_CACHE_LOCATION', os.path.join(CACHE_DIR, 'versions')
+        ),
+        'MAX_ENTRIES': os.getenv('VERSION_CACHE_MAX_ENTRIES', 200000),
+    },
+}
+
+# По умолчанию LocMemCache и FileBasedCache хранят 300 записей — меньше
+# одной страницы фрагментов. Memcached передает OPTIONS клиенту
+# и ограничивает память сам
+for cache_params in CACHES.values():
+    max_entries = int(cache_params.pop('MAX_ENTRIES'))
+    if 'memcached' not in cache_params['BACKEND']:
+        cache_params['OPTIONS'] = {'MAX_ENTRIES': max_entries}
+
+INGREDIENT_CATALOGUE_CACHE = (
+    os.getenv('INGREDIENT_CATALOGUE_CACHE', 'True') == 'True'
+)
+
+CATALOGUE_CACHE_MAX_AGE = int(os.getenv('CATALOGUE_CACHE_MAX_AGE', 60))
+
+RECIPE_RESPONSE_CACHE = os.getenv('RECIPE_RESPONSE_CACHE', 'True') == 'True'
+
+RECIPE_RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_RESPONSE_CACHE_TIMEOUT', 300)
+)
+
+RECIPE_FRAGMENT_CACHE = os.getenv('RECIPE_FRAGMENT_CACHE', 'True') == 'True'
+
+RECIPE_FRAGMENT_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_FRAGMENT_CACHE_TIMEOUT', 3600)
+)
+
+RECIPE_FEED_COUNT_MODE = os.getenv('RECIPE_FEED_COUNT_MODE', 'cached')
+
+RECIPE_FEED_COUNT_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_FEED_COUNT_CACHE_TIMEOUT', 60)
+)
+
+RECIPE_TRENDING_HALF_LIFE_HOURS = float(
+    os.getenv('RECIPE_TRENDING_HALF_LIFE_HOURS', 48)
+)
+
+FEED_FAN_OUT_MAX_FOLLOWERS = int(os.getenv('FEED_FAN_OUT_MAX_FOLLOWERS', 1000))
+
+FEED_BACKFILL_RECIPES = int(os.getenv('FEED_BACKFILL_RECIPES', 20))
+
+# Потоки, создающие уменьшенные копии изображений (api.images);
+# при 0 копии создает только команда process_image_renditions
+IMAGE_RENDITION_WORKERS = int(os.getenv('IMAGE_RENDITION_WORKERS', 2))
+
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.getenv('IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+)
+
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv('IMAGE_UPLOAD_MAX_PIXELS', 40_000_000))
+
+SHORT_LINK_CACHE_TIMEOUT = int(os.getenv('SHORT_LINK_CACHE_TIMEOUT', 86400))
+
+SHORT_LINK_MAX_AGE = int(os.getenv('SHORT_LINK_MAX_AGE', 3600))
+
+SHORT_LINK_FLUSH_HITS = int(os.getenv('SHORT_LINK_FLUSH_HITS', 100))
+
+SHORT_LINK_FLUSH_INTERVAL = int(os.getenv('SHORT_LINK_FLUSH_INTERVAL', 60))
+
+TOKEN_AUTH_CACHE = os.getenv('TOKEN_AUTH_CACHE', 'True') == 'True'
+
+TOKEN_AUTH_CACHE_TIMEOUT = int(os.getenv('TOKEN_AUTH_CACHE_TIMEOUT', 300))
+
+TOKEN_AUTH_LOCAL_CACHE_TIMEOUT = int(
+    os.getenv('TOKEN_AUTH_LOCAL_CACHE_TIMEOUT', 5)
+)
+
+TOKEN_AUTH_LOCAL_CACHE_SIZE = int(
+    os.getenv('TOKEN_AUTH_LOCAL_CACHE_SIZE', 1024)
+)
+
+REQUEST_METRICS_SERVER_TIMING = (
+    os.getenv('REQUEST_METRICS_SERVER_TIMING', 'True') == 'True'
+)
+
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1').split()
+
+QUERY_GUARD_MODE = os.getenv('QUERY_GUARD_MODE', '')
+
+QUERY_GUARD_MAX_REPEATS = int(os.getenv('QUERY_GUARD_MAX_REPEATS', 5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # Строки запросов пишутся при REQUEST_LOG_LEVEL=INFO; по умолчанию
+        # лог выключен, чтобы не засорять вывод тестов и команд
+        'api.requests': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+        'api.queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -122,7 +266,7 @@ AUTH_USER_MODEL = 'recipes.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -130,6 +274,16 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
+    # orjson, если установлен, иначе стандартный json
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 DJOSER = {
@@ -1,24 +1,26 @@
 from django.contrib import admin
 
 from .models import (CustomUser, Favorite, Ingredient, IngredientInRecipe,
-                     Recipe, ShoppingCart, Subscription, Tag)
+                     Recipe, RecipeScore, ShoppingCart,
+                     ShoppingCartAggregate, ShortLinkHits, Subscription, Tag,
+                     TimelineEntry)
 
 
 class CustomUserAdmin(admin.ModelAdmin):
     list_display = (
         'username', 'email', 'first_name', 'last_name',
+        'recipes_count', 'followers_count',
     )
     search_fields = ('username', 'email')
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'cooking_time', 'favorite_count')
+    list_display = (
+        'name', 'author', 'cooking_time', 'favorites_count', 'carts_count'
+    )
     search_fields = ('name', 'author__username')
     list_filter = ('tags',)
-
-    def favorite_count(self, obj):
-        return obj.favorited_by.count()
-    favorite_count.short_description = 'Добавлений в избранное'
+    list_select_related = ('author',)
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -34,3 +36,7 @@ admin.site.register(IngredientInRecipe)
 admin.site.register(Favorite)
 admin.site.register(ShoppingCart)
 admin.site.register(Subscription)
+admin.site.register(ShoppingCartAggregate)
+admin.site.register(RecipeScore)
+admin.site.register(TimelineEntry)
+admin.site.register(ShortLinkHits)
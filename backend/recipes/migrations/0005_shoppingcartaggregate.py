@@ -0,0 +1,51 @@
+# Generated by Django 3.2.3 on 2026-10-17 05:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_cart_aggregate(apps, schema_editor):
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    ShoppingCartAggregate = apps.get_model('recipes', 'ShoppingCartAggregate')
+    totals = (
+        ShoppingCart.objects
+        .values('user_id', ingredient_id=models.F(
+            'recipe__ingredient_in_recipe__ingredient_id'
+        ))
+        .filter(ingredient_id__isnull=False)
+        .annotate(amount=models.Sum('recipe__ingredient_in_recipe__amount'))
+        .order_by()
+    )
+    ShoppingCartAggregate.objects.bulk_create(
+        [ShoppingCartAggregate(**row) for row in totals.iterator()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_alter_subscription_follower'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_totals', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_totals', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Сумма ингредиента в списке покупок',
+                'verbose_name_plural': 'Суммы ингредиентов в списках покупок',
+                'ordering': ('id',),
+                'unique_together': {('user', 'ingredient')},
+            },
+        ),
+        migrations.RunPython(
+            fill_shopping_cart_aggregate, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-17 05:56
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_shoppingcartaggregate'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='ingredient',
+            unique_together={('name', 'measurement_unit')},
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+CREATE_INDEXES = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm;',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_lower_pattern '
+    'ON recipes_ingredient (LOWER(name) text_pattern_ops);',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_lower_trgm '
+    'ON recipes_ingredient USING gin (LOWER(name) gin_trgm_ops);',
+)
+DROP_INDEXES = (
+    'DROP INDEX IF EXISTS recipes_ingredient_name_lower_pattern;',
+    'DROP INDEX IF EXISTS recipes_ingredient_name_lower_trgm;',
+)
+
+
+def run_postgres_sql(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_ingredient_unique_name_unit'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_postgres_sql(CREATE_INDEXES), run_postgres_sql(DROP_INDEXES)
+        ),
+    ]
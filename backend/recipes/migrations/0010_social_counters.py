@@ -0,0 +1,57 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:11
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('Recipe', 'favorites_count', 'Favorite', 'recipe'),
+    ('Recipe', 'carts_count', 'ShoppingCart', 'recipe'),
+    ('CustomUser', 'recipes_count', 'Recipe', 'author'),
+    ('CustomUser', 'followers_count', 'Subscription', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, field, related_name, related_field in COUNTERS:
+        model = apps.get_model('recipes', model_name)
+        related_model = apps.get_model('recipes', related_name)
+        model.objects.update(**{field: Coalesce(
+            models.Subquery(
+                related_model.objects
+                .filter(**{related_field: models.OuterRef('pk')})
+                .order_by().values(related_field)
+                .annotate(count=models.Count('pk')).values('count')
+            ),
+            0
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество рецептов'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в список покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
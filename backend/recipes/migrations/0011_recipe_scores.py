@@ -0,0 +1,56 @@
+# Generated by Django 3.2.3 on 2026-10-17 09:40
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Дата добавления существующих записей неизвестна. Старая дата
+# не завышает популярность с учетом давности (trending) в первые дни
+EXISTING_ROWS_CREATED_AT = datetime.datetime(
+    1970, 1, 1, tzinfo=datetime.timezone.utc
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_social_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=EXISTING_ROWS_CREATED_AT, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=EXISTING_ROWS_CREATED_AT, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('popular', models.FloatField(default=0, verbose_name='Популярность')),
+                ('trending', models.FloatField(default=0, verbose_name='Популярность с учетом давности')),
+                ('computed_at', models.DateTimeField(verbose_name='Время расчета')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+                'ordering': ('-popular',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-popular', '-recipe'], name='recipescore_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-trending', '-recipe'], name='recipescore_trending_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShortLinkHits',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='short_link_hits', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('hits', models.PositiveIntegerField(default=0, verbose_name='Количество переходов')),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True, verbose_name='Время последней записи переходов')),
+            ],
+            options={
+                'verbose_name': 'Переходы по короткой ссылке',
+                'verbose_name_plural': 'Переходы по коротким ссылкам',
+                'ordering': ('-hits',),
+            },
+        ),
+    ]
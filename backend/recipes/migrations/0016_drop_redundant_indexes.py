@@ -0,0 +1,29 @@
+# Generated by Django 3.2.3 on 2026-10-17 07:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_short_link_hits'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='favorite',
+            name='favorite_recipe_user_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='ingredientinrecipe',
+            name='ingredientinrecipe_recipe_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='shoppingcart',
+            name='shoppingcart_recipe_user_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='subscription',
+            name='subscription_author_follow_idx',
+        ),
+    ]
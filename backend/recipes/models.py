@@ -14,9 +14,33 @@ from .constants import (
     RECIPE_MAX_LENGTH,
     TAG_MAX_LENGTH
 )
-
-
-class CustomUser(AbstractUser):
+from .storage import ContentAddressedStorage
+
+
+class CounterFieldsMixin:
+    """
+    Денормализованные счетчики counter_fields меняются только
+    выражениями F() (api.utils.change_counter), поэтому при сохранении
+    существующего объекта не записываются. Иначе объект, загруженный
+    до изменения счетчика в другом запросе, вернул бы старое значение.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            excluded = set(self.counter_fields) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in excluded
+            ]
+        super().save(*args, **kwargs)
+
+
+class CustomUser(CounterFieldsMixin, AbstractUser):
     """Кастомная модель пользователя."""
     email = models.EmailField(
         unique=True,
@@ -69,10 +93,17 @@ class CustomUser(AbstractUser):
     )
     avatar = models.ImageField(
         upload_to='avatars/',
+        storage=ContentAddressedStorage(),
         blank=True,
         null=True,
         verbose_name='Аватар',
     )
+    avatar_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии аватара',
+    )
     shopping_cart = models.ManyToManyField(
         'Recipe',
         through='ShoppingCart',
@@ -85,9 +116,20 @@ class CustomUser(AbstractUser):
         verbose_name='Избранное',
         related_name='user_favorites',
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков',
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -144,13 +186,14 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         default_related_name = 'ingredients'
+        unique_together = ('name', 'measurement_unit')
         ordering = ('id',)
 
     def __str__(self):
         return f'{self.name} - {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецепта."""
     author = models.ForeignKey(
         CustomUser,
@@ -168,10 +211,17 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/',
+        storage=ContentAddressedStorage(),
         blank=False,
         null=False,
         verbose_name='Изображение рецепта'
     )
+    image_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения'
+    )
     text = models.TextField(verbose_name='Описание рецепта')
     cooking_time = models.PositiveSmallIntegerField(
         validators=[
@@ -211,11 +261,33 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата создания рецепта'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в избранное'
+    )
+    carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в список покупок'
+    )
+
+    counter_fields = ('favorites_count', 'carts_count')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(
+                fields=('-created_at', '-id'),
+                name='recipe_created_at_id_idx'
+            ),
+            models.Index(
+                fields=('author', '-created_at'),
+                name='recipe_author_created_at_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -271,6 +343,11 @@ class Favorite(models.Model):
         related_name='favorited_by',
         verbose_name='Рецепт'
     )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         verbose_name = 'Избранное'
@@ -296,6 +373,11 @@ class ShoppingCart(models.Model):
         related_name='in_shopping_cart',
         verbose_name='Рецепт'
     )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -335,3 +417,143 @@ class Subscription(models.Model):
 
     def __str__(self):
         return f'{self.follower.username} подписан на {self.author.username}'
+
+
+class ShoppingCartAggregate(models.Model):
+    """
+    Суммарное количество ингредиента в списке покупок пользователя.
+    Денормализованная таблица: обновляется при изменении списка покупок
+    и состава рецептов, чтобы выгрузка списка не пересчитывала суммы.
+    """
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Сумма ингредиента в списке покупок'
+        verbose_name_plural = 'Суммы ингредиентов в списках покупок'
+        unique_together = ('user', 'ingredient')
+        ordering = ('id',)
+
+    def __str__(self):
+        return (
+            f'{self.user.username}: {self.ingredient.name} - {self.amount} '
+            f'{self.ingredient.measurement_unit}'
+        )
+
+
+class RecipeScore(models.Model):
+    """
+    Рейтинг рецепта для ранжированной ленты (ordering=popular|trending).
+    Пересчитывается командой update_recipe_scores, а не при запросе.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт'
+    )
+    popular = models.FloatField(default=0, verbose_name='Популярность')
+    trending = models.FloatField(
+        default=0,
+        verbose_name='Популярность с учетом давности'
+    )
+    computed_at = models.DateTimeField(verbose_name='Время расчета')
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        ordering = ('-popular',)
+        indexes = [
+            models.Index(
+                fields=('-popular', '-recipe'),
+                name='recipescore_popular_idx'
+            ),
+            models.Index(
+                fields=('-trending', '-recipe'),
+                name='recipescore_trending_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.popular:.1f} / {self.trending:.2f}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя. Записи создаются при
+    публикации рецепта для каждого подписчика автора (fan-out on write),
+    поэтому лента читается одним проходом по индексу.
+    """
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт'
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Дата публикации рецепта'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Лента подписок'
+        unique_together = ('user', 'recipe')
+        ordering = ('-created_at', '-recipe')
+        indexes = [
+            models.Index(
+                fields=('user', '-created_at', '-recipe'),
+                name='timeline_user_created_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipe_id}'
+
+
+class ShortLinkHits(models.Model):
+    """
+    Переходы по короткой ссылке на рецепт (/s/<код>). Переходы
+    копятся в памяти процесса и записываются пачками (api.shortlinks).
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='short_link_hits',
+        verbose_name='Рецепт'
+    )
+    hits = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество переходов'
+    )
+    last_hit_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Время последней записи переходов'
+    )
+
+    class Meta:
+        verbose_name = 'Переходы по короткой ссылке'
+        verbose_name_plural = 'Переходы по коротким ссылкам'
+        ordering = ('-hits',)
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.hits}'
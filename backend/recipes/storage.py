@@ -0,0 +1,45 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, в котором имя файла — SHA-256 содержимого:
+    recipes/ab/ab12...ef.jpeg. Повторная загрузка тех же байт
+    (например, изображение, которое фронтенд отправляет при каждом
+    PATCH) не записывает файл заново, а возвращает имя существующего.
+    Файлы общие для всех ссылающихся на них объектов, поэтому удаляются
+    не при изменении объекта, а командой collect_media_garbage.
+    """
+
+    def get_content_name(self, name, content):
+        """Имя файла по хешу содержимого в каталоге и с расширением name."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name)
+        hexdigest = digest.hexdigest()
+        return posixpath.join(
+            directory,
+            hexdigest[:2],
+            hexdigest + posixpath.splitext(filename)[1].lower()
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        if self.exists(name):
+            # Сборщик мусора не удаляет недавно использованные файлы
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)